@@ -3,49 +3,118 @@ import math
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
-class SimulatedAnnealing3D:
-    def init(self, seed, function : TestFunction, deviation : float) -> None:
+class SimulatedAnnealing:
+    def __init__(self, deviation : float, initial_temperature : float, min_temperature : float, cooling_factor : float,
+                 tempering : bool = False, swap_interval : int = 10, num_workers : int = None) -> None:
+        """
+        tempering: chains keep constant temperatures of geometric ladder from initial_temperature to min_temperature
+                   and neighboring chains try to swap states every swap_interval steps, otherwise all chains cool together
+        num_workers: number of processes chain evaluations are spread over, evaluated in this process when None
+        """
+        self.sigma = deviation
+        self.initialTemperature = initial_temperature
+        self.minTemperature = min_temperature
+        self.coolingFactor = cooling_factor
+        self.tempering = tempering
+        self.swapInterval = swap_interval
+        self.numWorkers = num_workers
+
+    def init(self, seed, function : TestFunction):
         self.seed = seed
         self.function = function
-        self.sigma = deviation
 
-    def search(self, initial_temperature : float, min_temperature : float, cooling_factor : float):
+    def temperatureLadder(self, num_chains : int) -> np.ndarray:
+        if num_chains == 1:
+            return np.array([self.initialTemperature])
+
+        return self.initialTemperature * (self.minTemperature / self.initialTemperature) ** (np.arange(num_chains) / (num_chains - 1))
+
+    @staticmethod
+    def swapStates(positions : np.ndarray, fitness : np.ndarray, temperatures : np.ndarray, first_chain : int) -> None:
+        # neighbors (first_chain, first_chain + 1), (first_chain + 2, first_chain + 3), ... exchange states by Metropolis criterion
+        lower = np.arange(first_chain, len(temperatures) - 1, 2)
+        upper = lower + 1
+
+        exponent = (1.0 / temperatures[lower] - 1.0 / temperatures[upper]) * (fitness[lower] - fitness[upper])
+        swap = np.log(np.random.uniform(size=len(lower))) < np.minimum(exponent, 0.0)
+
+        lower, upper = lower[swap], upper[swap]
+        positions[[*lower, *upper]] = positions[[*upper, *lower]]
+        fitness[[*lower, *upper]] = fitness[[*upper, *lower]]
+
+    def search(self, num_chains : int, M_max : int, max_evaluations : int) -> list:
+        """
+        M_max: maximal number of steps, cooling chains also stop when temperature falls below min_temperature
+        """
         self.function.setSamplingSeed(self.seed)
 
-        best_solutions = []
-        best_solutions_labels = []
+        evaluator = self.function if self.numWorkers is None else ParallelFunction(self.function, self.numWorkers)
+        self.counter = EvaluationCounter(evaluator, max_evaluations)
+
+        generations = []
+
+        # improvements of best solution over all chains as (d + 1) rows with labels
+        self.bestSolutions = []
+        self.bestSolutionsLabels = []
 
-        best_solution = self.function.randomSample()
-        best_solutions.append(best_solution)
-        best_solutions_labels.append("gen 0")
+        try:
+            positions, fitness = self.counter.randomSamplesArray(num_chains)
+            generations.append(np.column_stack((positions, fitness)))
 
-        temperature = initial_temperature
+            best_index = np.argmin(fitness)
+            self.bestSolutions.append((*positions[best_index], fitness[best_index]))
+            self.bestSolutionsLabels.append("gen 0")
 
-        while temperature > min_temperature:
-            sample = self.function.normalSample(best_solution[:2], self.sigma)
+            temperatures = self.temperatureLadder(num_chains) if self.tempering else np.full(num_chains, self.initialTemperature)
 
-            if sample[2] < best_solution[2]:
-                best_solution = sample
-                best_solutions.append(best_solution)
-                best_solutions_labels.append("Temperature {0}".format(temperature))
-            else :
-                r = np.random.uniform(0.0, 1.0)
-                magic_value = math.e ** ((-1 * (sample[2] - best_solution[2])) / temperature)
+            for step in range(1, M_max + 1):
+                if not self.tempering and temperatures[0] <= self.minTemperature:
+                    break
 
-                if r < magic_value:
-                    best_solution = sample
+                # every chain proposes one sample around its state, accepted by Metropolis criterion
+                samples, sample_fitness = self.counter.normalSamplesArray(positions, self.sigma, num_chains)
 
-            temperature *= cooling_factor
+                accepted = np.log(np.random.uniform(size=num_chains)) < -(sample_fitness - fitness) / temperatures
+                positions[accepted] = samples[accepted]
+                fitness[accepted] = sample_fitness[accepted]
 
-        resultX = []
-        resultY = []
-        resultZ = []
+                if self.tempering and step % self.swapInterval == 0:
+                    self.swapStates(positions, fitness, temperatures, (step // self.swapInterval) % 2)
+
+                generations.append(np.column_stack((positions, fitness)))
+
+                best_index = np.argmin(fitness)
+                if fitness[best_index] < self.bestSolutions[-1][-1]:
+                    self.bestSolutions.append((*positions[best_index], fitness[best_index]))
+                    self.bestSolutionsLabels.append("Temperature {0}".format(temperatures[best_index]))
+
+                if not self.tempering:
+                    temperatures = temperatures * self.coolingFactor
+        except EvaluationBudgetExhausted:
+            pass
+        finally:
+            if evaluator is not self.function:
+                evaluator.close()
+
+        return generations
+
+class SimulatedAnnealing3D:
+    def init(self, seed, function : TestFunction, deviation : float) -> None:
+        self.seed = seed
+        self.function = function
+        self.sigma = deviation
+
+    def search(self, initial_temperature : float, min_temperature : float, cooling_factor : float):
+        annealing = SimulatedAnnealing(self.sigma, initial_temperature, min_temperature, cooling_factor)
+        annealing.init(self.seed, self.function)
 
-        for point in best_solutions:
-            resultX.append(point[0])
-            resultY.append(point[1])
-            resultZ.append(point[2])
+        num_steps = math.ceil(math.log(min_temperature / initial_temperature) / math.log(cooling_factor))
+        annealing.search(1, num_steps, None)
 
-        return (resultX, resultY, resultZ, best_solutions_labels) 
+        resultX = [point[0] for point in annealing.bestSolutions]
+        resultY = [point[1] for point in annealing.bestSolutions]
+        resultZ = [point[2] for point in annealing.bestSolutions]
 
+        return (resultX, resultY, resultZ, annealing.bestSolutionsLabels)
@@ -4,48 +4,46 @@ import datetime
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
-class BlindSearch3D:
-    def init(self, seed, function : TestFunction, sigma):
+class BlindSearch:
+    def init(self, seed, function : TestFunction):
         self.seed = seed
         self.function = function
 
-    def search(self, num_samples : int, num_generations : int):
+    def search(self, num_samples : int, num_generations : int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
 
-        best_solutions = []
-        best_solutions_labels = []
+        generations = []
 
-        #1) first sample
-        best_solution = self.function.randomSample()
-        best_solutions.append(best_solution)
-        best_solutions_labels.append("gen 0")
+        # improvements of best solution as (d + 1) rows with labels
+        self.bestSolutions = []
+        self.bestSolutionsLabels = []
 
-        #2) generations
-        for gen_number in range(1, num_generations + 1):
-            samples = self.function.randomSamples(num_samples)
+        try:
+            for gen_number in range(num_generations + 1):
+                samples, evaluations = self.counter.randomSamplesArray(num_samples)
+                generations.append(np.column_stack((samples, evaluations)))
 
-            # select first sample
-            best_gen_solution = samples[0]
+                best_index = np.argmin(evaluations)
+                if not self.bestSolutions or evaluations[best_index] < self.bestSolutions[-1][-1]:
+                    self.bestSolutions.append((*samples[best_index], evaluations[best_index]))
+                    self.bestSolutionsLabels.append("gen {0}".format(gen_number))
+        except EvaluationBudgetExhausted:
+            pass
 
-            # compare with rest of samples
-            for sample in samples[1:]:
-                if sample[2] < best_gen_solution[0]:
-                    best_gen_solution = sample
+        return generations
 
-            # compare gen's best with overall best
-            if best_gen_solution[2] < best_solution[2]:
-                best_solution = best_gen_solution
-                best_solutions.append(best_solution)
-                best_solutions_labels.append("gen {0}".format(gen_number))
+class BlindSearch3D(BlindSearch):
+    def init(self, seed, function : TestFunction, sigma):
+        super().init(seed, function)
 
-        resultX = []
-        resultY = []
-        resultZ = []
+    def search(self, num_samples : int, num_generations : int):
+        super().search(num_samples, num_generations, None)
 
-        for point in best_solutions:
-            resultX.append(point[0])
-            resultY.append(point[1])
-            resultZ.append(point[2])
+        resultX = [point[0] for point in self.bestSolutions]
+        resultY = [point[1] for point in self.bestSolutions]
+        resultZ = [point[2] for point in self.bestSolutions]
 
-        return (resultX, resultY, resultZ, best_solutions_labels) 
\ No newline at end of file
+        return (resultX, resultY, resultZ, self.bestSolutionsLabels) 
@@ -0,0 +1,123 @@
+import numpy as np
+import os
+
+from collections import OrderedDict
+
+# Distances between broadcast coordinate arrays, accumulated coordinate by coordinate so every way
+# of asking for a distance rounds the same and no (..., d) temporary is needed
+def _pairDistances(first : np.ndarray, second : np.ndarray) -> np.ndarray:
+    squared = np.zeros(np.broadcast_shapes(first.shape[:-1], second.shape[:-1]))
+
+    for dim in range(first.shape[-1]):
+        difference = first[..., dim] - second[..., dim]
+        difference *= difference
+        squared += difference
+
+    return np.sqrt(squared, out=squared)
+
+# Distances from every row point to all points
+def _rowDistances(points : np.ndarray, row_points : np.ndarray) -> np.ndarray:
+    return _pairDistances(row_points[..., np.newaxis, :], points)
+
+class DistanceMatrix:
+    def __init__(self, points, dtype = np.float64, path : str = None, block_size : int = 1 << 22) -> None:
+        """
+        dtype: type of stored distances, np.float32 halves memory
+        path: .npy file the matrix is memory-mapped from, built and written there when it does not exist yet
+        block_size: number of distances computed at once while building
+        """
+        self.points = np.asarray(points, dtype=float)
+        self.num_points = len(self.points)
+        self.dimensions = self.points.shape[1]
+        self.dtype = np.dtype(dtype)
+        self.path = path
+
+        if path is not None and os.path.exists(path):
+            self.distances = np.load(path, mmap_mode="r")
+
+            if self.distances.shape != (self.num_points, self.num_points) or self.distances.dtype != self.dtype \
+                or not np.allclose(self.distances[0], self.rowDistances(0), rtol=1e-5):
+                raise RuntimeError("Distance matrix in {0} does not belong to given points".format(path))
+        else:
+            # file is built under temporary name and moved into place only when complete,
+            # so an interrupted build never leaves a partial matrix at path
+            tmp_path = path + ".tmp.npy" if path is not None else None
+
+            if path is not None:
+                self.distances = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(self.num_points, self.num_points))
+            else:
+                self.distances = np.empty((self.num_points, self.num_points), dtype=self.dtype)
+
+            rows_per_block = max(1, block_size // max(1, self.num_points))
+            for start in range(0, self.num_points, rows_per_block):
+                end = min(start + rows_per_block, self.num_points)
+                self.distances[start:end] = self.rowDistances(slice(start, end))
+
+            if path is not None:
+                self.distances.flush()
+                del self.distances
+
+                os.replace(tmp_path, path)
+                self.distances = np.load(path, mmap_mode="r")
+
+    def rowDistances(self, rows) -> np.ndarray:
+        return _rowDistances(self.points, self.points[rows])
+
+    def row(self, index : int) -> np.ndarray:
+        return self.distances[index]
+
+    def at(self, row : int, column : int) -> float:
+        return self.distances[row, column]
+
+    def edgeLengths(self, rows : np.ndarray, columns : np.ndarray) -> np.ndarray:
+        return self.distances[rows, columns]
+
+    def evaluatePath(self, indicies : list[int]) -> float:
+        indicies = np.asarray(indicies)
+
+        return float(np.sum(self.distances[indicies[:-1], indicies[1:]], dtype=np.float64))
+
+# Computes distances from coordinates when asked, recently used rows are kept in LRU cache,
+# memory grows linearly with number of points
+class OnDemandDistances:
+    def __init__(self, points, dtype = np.float64, cache_rows : int = 1024) -> None:
+        """
+        cache_rows: number of distance rows kept in cache
+        """
+        self.points = np.asarray(points, dtype=float)
+        self.num_points = len(self.points)
+        self.dimensions = self.points.shape[1]
+        self.dtype = np.dtype(dtype)
+
+        self.cacheRows = cache_rows
+        self.rows = OrderedDict()
+
+    def row(self, index : int) -> np.ndarray:
+        if index in self.rows:
+            self.rows.move_to_end(index)
+
+            return self.rows[index]
+
+        row = _rowDistances(self.points, self.points[index]).astype(self.dtype, copy=False)
+
+        if self.cacheRows > 0:
+            self.rows[index] = row
+            if len(self.rows) > self.cacheRows:
+                self.rows.popitem(last=False)
+
+        return row
+
+    # distances are rounded to dtype whether they come from cached row or not, so the same edge always has one value
+    def at(self, row : int, column : int) -> float:
+        if row in self.rows:
+            return float(self.rows[row][column])
+
+        return float(self.dtype.type(_pairDistances(self.points[row], self.points[column])))
+
+    def edgeLengths(self, rows : np.ndarray, columns : np.ndarray) -> np.ndarray:
+        return _pairDistances(self.points[rows], self.points[columns]).astype(self.dtype, copy=False)
+
+    def evaluatePath(self, indicies : list[int]) -> float:
+        indicies = np.asarray(indicies)
+
+        return float(np.sum(self.edgeLengths(indicies[:-1], indicies[1:]), dtype=np.float64))
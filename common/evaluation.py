@@ -0,0 +1,228 @@
+import numpy as np
+import math
+import os
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from common.functions import *
+
+class CachedFunction(FunctionWrapper):
+    def __init__(self, function : TestFunction, max_size : int = 100000) -> None:
+        """
+        max_size: maximal number of remembered evaluations, least recently used are evicted first, None for unbounded cache
+        """
+        super().__init__(function)
+
+        self.maxSize = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def pointKey(point) -> bytes:
+        return np.ascontiguousarray(point, dtype=float).tobytes()
+
+    def remember(self, key : bytes, evaluation : float) -> None:
+        if self.maxSize is not None and self.maxSize <= 0:
+            return
+
+        self.cache[key] = evaluation
+        self.cache.move_to_end(key)
+
+        if self.maxSize is not None and len(self.cache) > self.maxSize:
+            self.cache.popitem(last=False)
+
+    def calculate(self, params : tuple[float, ...]) -> float:
+        key = self.pointKey(params)
+
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+
+            return self.cache[key]
+
+        self.misses += 1
+        evaluation = self.function.calculate(params)
+        self.remember(key, evaluation)
+
+        return evaluation
+
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        evaluations = np.empty(len(points), dtype=float)
+
+        # rows of the batch waiting for evaluation, grouped by point so duplicates are evaluated once
+        pending = {}
+
+        for index, point in enumerate(points):
+            key = self.pointKey(point)
+
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                evaluations[index] = self.cache[key]
+            elif key in pending:
+                self.hits += 1
+                pending[key].append(index)
+            else:
+                self.misses += 1
+                pending[key] = [index]
+
+        if pending:
+            first_indicies = [indicies[0] for indicies in pending.values()]
+            new_evaluations = self.function.calculateBatch(points[first_indicies])
+
+            for (key, indicies), evaluation in zip(pending.items(), new_evaluations):
+                evaluations[indicies] = evaluation
+                self.remember(key, evaluation)
+
+        return evaluations
+
+    def getHits(self) -> int:
+        return self.hits
+
+    def getMisses(self) -> int:
+        return self.misses
+
+    def getSize(self) -> int:
+        return len(self.cache)
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+class EvaluationBudgetExhausted(Exception):
+    pass
+
+class EvaluationCounter(FunctionWrapper):
+    def __init__(self, function : TestFunction, max_evaluations : int = None) -> None:
+        """
+        max_evaluations: evaluations allowed in total, request that would exceed it raises EvaluationBudgetExhausted
+                         before anything is evaluated, None for unlimited budget
+        """
+        super().__init__(function)
+
+        self.maxEvaluations = max_evaluations
+        self.evaluations = 0
+
+        # (evaluations spent, best evaluation) recorded whenever best evaluation improves
+        self.best = np.inf
+        self.improvements = []
+
+    def reserve(self, num_evaluations : int) -> None:
+        if self.maxEvaluations is not None and self.evaluations + num_evaluations > self.maxEvaluations:
+            raise EvaluationBudgetExhausted("Budget of {0} evaluations exhausted, {1} used, {2} requested".format(
+                self.maxEvaluations, self.evaluations, num_evaluations))
+
+        self.evaluations += num_evaluations
+
+    def record(self, evaluations : np.ndarray) -> None:
+        first_evaluation = self.evaluations - len(evaluations)
+
+        for index in np.flatnonzero(evaluations < self.best):
+            if evaluations[index] < self.best:
+                self.best = evaluations[index]
+                self.improvements.append((int(first_evaluation + index + 1), self.best))
+
+    def calculate(self, params : tuple[float, ...]) -> float:
+        self.reserve(1)
+
+        evaluation = self.function.calculate(params)
+        self.record(np.array([evaluation]))
+
+        return evaluation
+
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        self.reserve(len(points))
+
+        evaluations = self.function.calculateBatch(points)
+        self.record(evaluations)
+
+        return evaluations
+
+    def getBest(self) -> float:
+        return self.best
+
+    # Number of evaluations spent before best evaluation first got to target, None if it never did
+    def getEvaluationsToTarget(self, target : float) -> int:
+        for evaluations, best in self.improvements:
+            if best <= target:
+                return evaluations
+
+        return None
+
+    def getEvaluations(self) -> int:
+        return self.evaluations
+
+    def getRemaining(self) -> int:
+        if self.maxEvaluations is None:
+            return None
+
+        return self.maxEvaluations - self.evaluations
+
+# Stand-in for expensive objective, burns CPU on every evaluation
+class SlowSphere(Sphere):
+    def calculate(self, params) -> float:
+        deadline = time.perf_counter() + 0.005
+        while time.perf_counter() < deadline:
+            pass
+
+        return super().calculate(params)
+
+    def calculateBatch(self, points) -> np.ndarray:
+        return np.array([self.calculate(point) for point in points])
+
+# Function evaluated by worker process, set once per worker so it is not sent with every chunk
+_worker_function = None
+
+def _initWorker(function : TestFunction) -> None:
+    global _worker_function
+    _worker_function = function
+
+def _evaluateChunk(points : np.ndarray) -> np.ndarray:
+    return _worker_function.calculateBatch(points)
+
+class ParallelFunction(FunctionWrapper):
+    def __init__(self, function : TestFunction, max_workers : int = None, chunk_size : int = None) -> None:
+        """
+        max_workers: number of worker processes, number of cores by default
+        chunk_size: number of points sent to worker at once, by default batch is split into 4 chunks per worker
+        """
+        super().__init__(function)
+
+        self.maxWorkers = max_workers if max_workers is not None else os.cpu_count()
+        self.chunkSize = chunk_size
+        self.executor = None
+
+    def getExecutor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.maxWorkers, initializer=_initWorker, initargs=(self.function,))
+
+        return self.executor
+
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        if len(points) < 2 or self.maxWorkers < 2:
+            return self.function.calculateBatch(points)
+
+        chunk_size = self.chunkSize if self.chunkSize is not None else math.ceil(len(points) / (4 * self.maxWorkers))
+        chunks = [points[start:start + chunk_size] for start in range(0, len(points), chunk_size)]
+
+        # map keeps order of chunks
+        return np.concatenate(list(self.getExecutor().map(_evaluateChunk, chunks)))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -1,14 +1,54 @@
 import numpy as np
 import random
+import math
 
 
 from common.interval import *
 
+# Coefficients of Acklam's rational approximation of the standard normal quantile function
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+_PPF_LOW = 0.02425
+
+# Coefficients of Chebyshev fitted complementary error function, fractional error below 1.2e-7 everywhere
+_ERFC_C = (0.17087277, -0.82215223, 1.48851587, -1.13520398, 0.27886807, -0.18628806, 0.09678418, 0.37409196, 1.00002368, -1.26551223)
+
+def _normalCdf(x : np.ndarray) -> np.ndarray:
+    # 0.5 * erfc(-x / sqrt(2)), relative accuracy holds in both tails
+    z = np.abs(np.asarray(x, dtype=float)) / math.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.5 * z)
+    tail = 0.5 * t * np.exp(-z * z + np.polyval(_ERFC_C, t))
+
+    return np.where(np.asarray(x) >= 0.0, 1.0 - tail, tail)
+
+def _normalPpf(p : np.ndarray) -> np.ndarray:
+    p = np.clip(p, np.finfo(float).tiny, 1.0 - np.finfo(float).epsneg)
+    result = np.empty_like(p)
+
+    lower = p < _PPF_LOW
+    upper = p > 1.0 - _PPF_LOW
+    central = ~(lower | upper)
+
+    q = np.sqrt(-2.0 * np.log(np.where(lower, p, np.where(upper, 1.0 - p, 0.5))))
+    tail = np.polyval(_PPF_C, q) / np.polyval((*_PPF_D, 1.0), q)
+    result[lower] = tail[lower]
+    result[upper] = -tail[upper]
+
+    q = p[central] - 0.5
+    r = q * q
+    result[central] = np.polyval(_PPF_A, r) * q / np.polyval((*_PPF_B, 1.0), r)
+
+    return result
+
 class TestFunction:
     def __init__(self, bounds : list[tuple[float, float]]) -> None:
         self.bounds = bounds[:-1]
         self.viewPort = Interval3D((*bounds[0], 0.1), (*bounds[1], 0.1), (*bounds[2], 0.1))
         self.scales = [abs(bound[1] - bound[0]) for bound in self.bounds]
+        self.lowerBounds = np.array([bound[0] for bound in self.bounds], dtype=float)
+        self.upperBounds = np.array([bound[1] for bound in self.bounds], dtype=float)
 
         self.samplingSeed = None
 
@@ -47,16 +87,50 @@ class TestFunction:
         return [tuple([random.random() * (mx - mn) + mn for mn, mx in self.bounds]) for _ in range(num_points)]
 
     def normalSample(self, center : tuple[float, ...], sigma : float) -> tuple[float, ...]:
-        scaled_sigmas = [sigma * scale for sigma, scale in self.scales]
-        point = np.random.normal(center, scaled_sigmas)  
-
-        while any(point[dim] < self.bounds[dim][0] or point[dim] > self.bounds[dim][1] for dim in range(len(center))):
-             point = np.random.normal(center, scaled_sigmas)
+        point = self.normalPositions(center, sigma, 1)[0]
 
         return (*point, self.calculate(point))
     
     def normalSamples(self, center : tuple[float, ...], sigma : float, num_samples : int) -> list:
-        return [self.normalSample(center, sigma) for _ in range(num_samples)]
+        positions, evaluations = self.normalSamplesArray(center, sigma, num_samples)
+
+        return [(*position, evaluation) for position, evaluation in zip(positions, evaluations)]
+
+    def randomPositions(self, num_points : int) -> np.ndarray:
+        return np.random.uniform(self.lowerBounds, self.upperBounds, (num_points, len(self.bounds)))
+
+    def randomSamplesArray(self, num_samples : int) -> tuple[np.ndarray, np.ndarray]:
+        positions = self.randomPositions(num_samples)
+
+        return positions, self.calculateBatch(positions)
+
+    # Samples each dimension from normal distribution truncated to bounds by inverse transform, so no point is redrawn,
+    # center is either single point or (num_points, d) array with own center for every point
+    def normalPositions(self, center : tuple[float, ...], sigma : float, num_points : int) -> np.ndarray:
+        center = np.asarray(center, dtype=float)
+        scaled_sigmas = sigma * np.asarray(self.scales, dtype=float)
+
+        alpha = (self.lowerBounds - center) / scaled_sigmas
+        beta = (self.upperBounds - center) / scaled_sigmas
+
+        # sample the mirrored interval where both bounds lie above center to stay in the precise tail of the cdf
+        mirrored = alpha > 0.0
+        low = np.where(mirrored, -beta, alpha)
+        high = np.where(mirrored, -alpha, beta)
+
+        cdf_low = _normalCdf(low)
+        cdf_high = _normalCdf(high)
+
+        uniform = np.random.uniform(size=(num_points, len(self.bounds)))
+        standard = _normalPpf(cdf_low + uniform * (cdf_high - cdf_low))
+        standard = np.where(mirrored, -standard, standard)
+
+        return np.clip(center + standard * scaled_sigmas, self.lowerBounds, self.upperBounds)
+
+    def normalSamplesArray(self, center : tuple[float, ...], sigma : float, num_samples : int) -> tuple[np.ndarray, np.ndarray]:
+        positions = self.normalPositions(center, sigma, num_samples)
+
+        return positions, self.calculateBatch(positions)
     
     def preserveBoundsLoopAround(self, point : tuple[float, ...]) -> tuple[float, ...] :
         new_point = []
@@ -81,10 +155,54 @@ class TestFunction:
 
         return tuple(new_point)
     
+    def preserveBoundsLoopAroundBatch(self, points : np.ndarray) -> np.ndarray:
+        points = np.asarray(points, dtype=float)
+        scales = np.asarray(self.scales, dtype=float)
+
+        return np.where(points < self.lowerBounds, points + scales, np.where(points > self.upperBounds, points - scales, points))
+
+    def preserveBoundsSetAtBorderBatch(self, points : np.ndarray) -> np.ndarray:
+        return np.clip(points, self.lowerBounds, self.upperBounds)
+
+    # Position of global minimum, overridden by test functions whose minimum is not at the origin
+    def optimum(self) -> np.ndarray:
+        return np.zeros(len(self.bounds))
+
     # Implemented by each test function
     def calculate(self, params : tuple[float, ...]) -> float:
         raise NotImplemented("Calculate function is not implemented")
 
+    # Evaluates rows of (n, d) array, overridden with vectorized version by each test function
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        return np.array([self.calculate(point) for point in points], dtype=float)
+
+# Base for objects standing in for a test function, delegates to wrapped function by default
+class FunctionWrapper(TestFunction):
+    def __init__(self, function : TestFunction) -> None:
+        self.function = function
+
+        self.bounds = function.bounds
+        self.viewPort = function.viewPort
+        self.scales = function.scales
+        self.lowerBounds = function.lowerBounds
+        self.upperBounds = function.upperBounds
+
+        self.samplingSeed = function.samplingSeed
+
+    def getWrapped(self) -> TestFunction:
+        return self.function
+
+    def optimum(self) -> np.ndarray:
+        return self.function.optimum()
+
+    def calculate(self, params : tuple[float, ...]) -> float:
+        return self.function.calculate(params)
+
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        return self.function.calculateBatch(points)
+
 class Sphere(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-5.12, 5.12) for _ in range(dims -1)], (0.0, 100.0)))
@@ -96,6 +214,11 @@ class Sphere(TestFunction):
             
         return sum
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        return np.sum(points * points, axis=1)
+
 class Ackley(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-32.768, 32.768) for _ in range(dims -1)], (0.0, 25.0)))
@@ -112,6 +235,20 @@ class Ackley(TestFunction):
 
         return - a * np.exp(sqrt_part) - np.exp(cos_part) + a + np.exp(1)
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        a = 20
+        b = 0.2
+        c = 2 * np.pi
+
+        one_over_dimension = 1.0 / points.shape[1]
+
+        cos_part = one_over_dimension * np.sum(np.cos(c * points), axis=1)
+        sqrt_part = - b * np.sqrt(one_over_dimension * np.sum(points * points, axis=1))
+
+        return - a * np.exp(sqrt_part) - np.exp(cos_part) + a + np.exp(1)
+
 class Rastrigin(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-5.12, 5.12) for _ in range(dims -1)], (0.0, 100.0)))
@@ -121,10 +258,19 @@ class Rastrigin(TestFunction):
 
        return 10 * num_dimensions + sum([(x * x - 10 * np.cos(2 * np.pi * x)) for x in params])
 
+    def calculateBatch(self, points) -> np.ndarray:
+       points = np.atleast_2d(np.asarray(points, dtype=float))
+       num_dimensions = points.shape[1]
+
+       return 10 * num_dimensions + np.sum(points * points - 10 * np.cos(2 * np.pi * points), axis=1)
+
 class Rosenbrock(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-10.0, 10) for _ in range (dims -1)], (0.0, 1000000.0)))
 
+    def optimum(self) -> np.ndarray:
+        return np.ones(len(self.bounds))
+
     def calculate(self, params) -> float:
         result = 0.0
 
@@ -134,6 +280,14 @@ class Rosenbrock(TestFunction):
 
         return result
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        x_i = points[:, :-1]
+        x_next = points[:, 1:]
+
+        return np.sum(100 * ((x_next - (x_i * x_i)) ** 2) + ((x_i - 1) ** 2), axis=1)
+
 class Griewank(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-5.0, 5.0) for _ in range(dims - 1)], (0.0, 3.0)))
@@ -148,17 +302,38 @@ class Griewank(TestFunction):
 
         return sum_result - prod_result + 1.0
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        sqrt_indicies = np.sqrt(np.arange(1, points.shape[1] + 1, dtype=float))
+
+        sum_result = np.sum(points * points, axis=1) / 400.0
+        prod_result = np.prod(np.cos(points / sqrt_indicies), axis=1)
+
+        return sum_result - prod_result + 1.0
+
 class Schwefel(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-500.0, 500.0) for _ in range(dims -1)], (0.0, 2000)))
 
+    def optimum(self) -> np.ndarray:
+        return np.full(len(self.bounds), 420.968746)
+
     def calculate(self, params) -> float:
-        return 418.9829 * len(params) - sum([x * np.sin(np.sqrt(abs(x))) for x in params])  
+        return 418.9829 * len(params) - sum([x * np.sin(np.sqrt(abs(x))) for x in params])
+
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        return 418.9829 * points.shape[1] - np.sum(points * np.sin(np.sqrt(np.abs(points))), axis=1)
 
 class Levy(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-10.0, 10.0) for _ in range(dims - 1)],(0, 100.0)))
 
+    def optimum(self) -> np.ndarray:
+        return np.ones(len(self.bounds))
+
     def calculate(self, params) -> float:
         def w_i(x):
             return 1.0 + ((x - 1.0) / 4.0)
@@ -168,11 +343,40 @@ class Levy(TestFunction):
         term3 = ((w_i(params[-1]) -1) ** 2)*(1 + np.sin(2 * np.pi * w_i(params[-1])))
 
         return term1 + term2 + term3
-        
+
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        w = 1.0 + ((points - 1.0) / 4.0)
+        w_inner = w[:, :-1]
+        w_last = w[:, -1]
+
+        term1 = np.sin(np.pi * w[:, 0]) ** 2
+        term2 = np.sum((w_inner - 1) ** 2 * (1 + 10 * (np.sin(np.pi * w_inner + 1.0) ** 2)), axis=1)
+        term3 = ((w_last - 1) ** 2) * (1 + np.sin(2 * np.pi * w_last))
+
+        return term1 + term2 + term3
+
 class Michalewicz(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(0, np.pi) for _ in range(dims - 1)], (-2.0, 0.0)))
 
+    # Function is separable, every coordinate is minimized on its own over a grid refined around its best point
+    def optimum(self) -> np.ndarray:
+        m = 10
+        indicies = np.arange(1, len(self.bounds) + 1, dtype=float)[:, np.newaxis]
+
+        low, high = np.zeros_like(indicies), np.full_like(indicies, np.pi)
+        for _ in range(3):
+            grid = np.linspace(low, high, 20001, axis=1)[:, :, 0]
+            values = -np.sin(grid) * (np.sin((indicies * grid * grid) / np.pi) ** (2 * m))
+
+            best = grid[np.arange(len(grid)), np.argmin(values, axis=1)][:, np.newaxis]
+            step = (high - low) / 20000.0
+            low, high = np.maximum(best - step, 0.0), np.minimum(best + step, np.pi)
+
+        return best[:, 0]
+
     def calculate(self, params) -> float:
         m = 10
 
@@ -184,6 +388,14 @@ class Michalewicz(TestFunction):
 
         return -result
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        m = 10
+
+        indicies = np.arange(1, points.shape[1] + 1, dtype=float)
+
+        return -np.sum(np.sin(points) * (np.sin((indicies * points * points) / np.pi) ** (2 * m)), axis=1)
+
 class Zakharov(TestFunction):
     def __init__(self, dims : int) -> None:
         super().__init__((*[(-5, 10) for _ in range(dims - 1)], (0, 100000.0)))
@@ -200,6 +412,16 @@ class Zakharov(TestFunction):
 
         return tmp1 + tmp2 ** 2 + tmp2 ** 4
 
+    def calculateBatch(self, points) -> np.ndarray:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        indicies = np.arange(1, points.shape[1] + 1, dtype=float)
+
+        tmp1 = np.sum(points * points, axis=1)
+        tmp2 = np.sum(0.5 * indicies * points, axis=1)
+
+        return tmp1 + tmp2 ** 2 + tmp2 ** 4
+
 class Functions:
     def __init__(self, dims : int) :
         self.sphere = Sphere(dims) 
@@ -216,6 +438,112 @@ class Functions3D(Functions):
     def __init__(self):
         super().__init__(3)
        
-class Functions30D:
+class Functions30D(Functions):
     def __init__(self):
-        super().__init__(30)
\ No newline at end of file
+        super().__init__(30)
+
+# CEC style variant of test function evaluated at rotation @ (point - shift)
+# Evaluates f(R(x - o) + x*) where x* is optimum of wrapped function, so optimum moves to o and rotation turns
+# the landscape around it. Arguments are clipped to bounds of wrapped function so regions outside its domain
+# (Schwefel beyond 500) can not undercut the optimum.
+class ShiftedRotatedFunction(FunctionWrapper):
+    def __init__(self, function : TestFunction, shift : np.ndarray = None, rotation : np.ndarray = None) -> None:
+        """
+        shift: new position o of the optimum, optimum stays in place when None
+        rotation: orthogonal matrix R, no rotation when None
+        """
+        super().__init__(function)
+
+        self.baseOptimum = np.asarray(function.optimum(), dtype=float)
+        self.shift = self.baseOptimum.copy() if shift is None else np.asarray(shift, dtype=float)
+        self.rotation = None if rotation is None else np.asarray(rotation, dtype=float)
+
+    def optimum(self) -> np.ndarray:
+        return self.shift
+
+    def transform(self, points : np.ndarray) -> np.ndarray:
+        shifted = np.asarray(points, dtype=float) - self.shift
+        rotated = shifted if self.rotation is None else shifted @ self.rotation.T
+
+        return np.clip(rotated + self.baseOptimum, self.function.lowerBounds, self.function.upperBounds)
+
+    def calculate(self, params : tuple[float, ...]) -> float:
+        return self.function.calculate(self.transform(params))
+
+    def calculateBatch(self, points : np.ndarray) -> np.ndarray:
+        return self.function.calculateBatch(self.transform(np.atleast_2d(points)))
+
+class FunctionRegistry:
+    functionTypes = {
+        "sphere": Sphere,
+        "ackley": Ackley,
+        "rastrigin": Rastrigin,
+        "rosenbrock": Rosenbrock,
+        "griewank": Griewank,
+        "schwefel": Schwefel,
+        "levy": Levy,
+        "michalewicz": Michalewicz,
+        "zakharov": Zakharov,
+    }
+
+    def __init__(self, seed : int = 0) -> None:
+        """
+        seed: seed of shift vectors and rotation matrices, sampling seed of the functions is not affected
+        """
+        self.seed = seed
+
+        self.functions = {}
+        self.shifts = {}
+        self.rotations = {}
+
+    def names(self) -> list[str]:
+        return list(self.functionTypes.keys())
+
+    def get(self, name : str, dims : int, shifted : bool = False, rotated : bool = False) -> TestFunction:
+        """
+        dims: number of axes including the fitness axis, same as in test function constructors
+        """
+        key = (name, dims, shifted, rotated)
+
+        if key not in self.functions:
+            if shifted or rotated:
+                base = self.get(name, dims)
+                shift = self.getShift(name, dims) if shifted else None
+                rotation = self.getRotation(name, dims) if rotated else None
+
+                self.functions[key] = ShiftedRotatedFunction(base, shift, rotation)
+            else:
+                self.functions[key] = self.functionTypes[name](dims)
+
+        return self.functions[key]
+
+    def getAll(self, dims : int, shifted : bool = False, rotated : bool = False) -> dict[str, TestFunction]:
+        return {name: self.get(name, dims, shifted, rotated) for name in self.names()}
+
+    def generator(self, name : str, dims : int, purpose : int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, self.names().index(name), dims, purpose])
+
+    # Shift is the new optimum position, drawn inside 80% of the search space around its center
+    def getShift(self, name : str, dims : int) -> np.ndarray:
+        key = (name, dims)
+
+        if key not in self.shifts:
+            base = self.get(name, dims)
+            center = (base.lowerBounds + base.upperBounds) / 2.0
+            half_width = (base.upperBounds - base.lowerBounds) / 2.0
+
+            self.shifts[key] = center + 0.8 * half_width * self.generator(name, dims, 0).uniform(-1.0, 1.0, len(center))
+
+        return self.shifts[key]
+
+    # Random orthogonal matrix from QR decomposition of gaussian matrix
+    def getRotation(self, name : str, dims : int) -> np.ndarray:
+        key = (name, dims)
+
+        if key not in self.rotations:
+            num_dimensions = len(self.get(name, dims).bounds)
+            q, r = np.linalg.qr(self.generator(name, dims, 1).standard_normal((num_dimensions, num_dimensions)))
+
+            self.rotations[key] = q * np.sign(np.diag(r))
+
+        return self.rotations[key]
\ No newline at end of file
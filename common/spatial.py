@@ -0,0 +1,97 @@
+import numpy as np
+
+# Uniform grid over first grid_dims coordinates of points, answers k nearest neighbor queries
+# for all points at once, cell by cell
+class GridIndex:
+    def __init__(self, points : np.ndarray, grid_dims : int = 2, points_per_cell : float = 8.0, cell_size : float = None) -> None:
+        """
+        grid_dims: number of leading coordinates the grid is built over
+        points_per_cell: average occupancy the cell size is chosen for when cell_size is not given
+        """
+        self.points = np.asarray(points, dtype=float)
+        self.gridDims = min(grid_dims, self.points.shape[1])
+
+        projected = self.points[:, :self.gridDims]
+        self.origin = projected.min(axis=0)
+        extent = np.maximum(projected.max(axis=0) - self.origin, np.finfo(float).eps)
+
+        if cell_size is None:
+            cell_size = (np.prod(extent) * points_per_cell / len(self.points)) ** (1.0 / self.gridDims)
+
+        self.cellSize = max(float(cell_size), np.finfo(float).eps)
+        self.shape = np.floor(extent / self.cellSize).astype(np.int64) + 1
+
+        self.cells = np.minimum(np.floor((projected - self.origin) / self.cellSize).astype(np.int64), self.shape - 1)
+        keys = np.ravel_multi_index(self.cells.T, self.shape)
+
+        # points sorted by cell, every occupied cell is a contiguous run
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+
+    def cellMembers(self, key_index : int) -> np.ndarray:
+        start = self.starts[key_index]
+
+        return self.order[start:start + self.counts[key_index]]
+
+    def ringMembers(self, cell : np.ndarray, radius : int) -> np.ndarray:
+        offsets = np.stack(np.meshgrid(*[np.arange(-radius, radius + 1)] * self.gridDims, indexing="ij"), axis=-1).reshape(-1, self.gridDims)
+        neighbors = cell + offsets
+        neighbors = neighbors[np.all((neighbors >= 0) & (neighbors < self.shape), axis=1)]
+
+        keys = np.ravel_multi_index(neighbors.T, self.shape)
+        positions = np.searchsorted(self.keys, keys)
+
+        occupied = positions < len(self.keys)
+        occupied[occupied] = self.keys[positions[occupied]] == keys[occupied]
+        positions = positions[occupied]
+
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate([self.cellMembers(position) for position in positions])
+
+    def nearest(self, k : int, accept = None, max_radius : int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (n, k) indicies and distances of k nearest other points of every point, missing neighbors have index -1
+        and infinite distance.
+        accept: optional function (rows, candidates) -> bool matrix, rejected candidates are not neighbors
+        max_radius: number of rings of cells searched at most, None searches until result is exact
+        """
+        num_points = len(self.points)
+        indicies = np.full((num_points, k), -1, dtype=np.int64)
+        distances = np.full((num_points, k), np.inf)
+
+        full_radius = int(np.max(self.shape))
+        max_radius = full_radius if max_radius is None else min(max_radius, full_radius)
+
+        for key_index in range(len(self.keys)):
+            rows = self.cellMembers(key_index)
+            cell = self.cells[rows[0]]
+
+            radius = 1
+            while True:
+                candidates = self.ringMembers(cell, radius)
+
+                difference = self.points[rows][:, np.newaxis, :] - self.points[candidates][np.newaxis, :, :]
+                candidate_distances = np.sqrt(np.sum(difference * difference, axis=2))
+                candidate_distances[rows[:, np.newaxis] == candidates[np.newaxis, :]] = np.inf
+
+                if accept is not None:
+                    candidate_distances[~accept(rows, candidates)] = np.inf
+
+                num_found = min(k, len(candidates))
+                closest = np.argsort(candidate_distances, axis=1)[:, :num_found]
+                closest_distances = np.take_along_axis(candidate_distances, closest, axis=1)
+
+                # points outside searched rings are farther than radius cells from every point of the cell
+                kth_distance = np.max(closest_distances[:, -1]) if num_found == k else np.inf
+                if kth_distance <= radius * self.cellSize or radius >= max_radius:
+                    break
+
+                radius += 1
+
+            found = np.isfinite(closest_distances)
+            indicies[rows, :num_found] = np.where(found, candidates[closest], -1)
+            distances[rows, :num_found] = closest_distances
+
+        return indicies, distances
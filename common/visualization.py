@@ -1,5 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import hashlib
+import os
 from matplotlib import cm
 from common.interval import *
 
@@ -19,10 +21,41 @@ class Visualisation:
     def saveFig(self, path : str, file_format="pdf") -> None:
         plt.savefig(path, format=file_format) 
 
+# Stores evaluated function surfaces as .npz files keyed by function name, viewport and mesh resolution
+class SurfaceCache:
+    def __init__(self, directory : str) -> None:
+        self.directory = directory
+
+    def path(self, name : str, viewport : Interval3D, mesh_grid : Interval2D) -> str:
+        key = repr((viewport.getXInteval(), viewport.getYInteval(), viewport.getZInteval(),
+                    mesh_grid.getXInteval(), mesh_grid.getYInteval()))
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+        return os.path.join(self.directory, "{0}-{1}.npz".format(name, digest))
+
+    def load(self, name : str, viewport : Interval3D, mesh_grid : Interval2D):
+        path = self.path(name, viewport, mesh_grid)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as surface:
+            return (surface["X"], surface["Y"], surface["Z"])
+
+    def store(self, name : str, viewport : Interval3D, mesh_grid : Interval2D, surface) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self.path(name, viewport, mesh_grid)
+        tmp_path = path + ".tmp.npz"
+
+        X, Y, Z = surface
+        np.savez(tmp_path, X=X, Y=Y, Z=Z)
+        os.replace(tmp_path, path)
+
 class Visualisation3D(Visualisation):
-    def __init__(self, antialiasing = False) -> None:
+    def __init__(self, antialiasing = False, surface_cache : SurfaceCache = None) -> None:
         super().__init__()
         self.antialiasing = antialiasing
+        self.surfaceCache = surface_cache
 
     def plotSurface(self, viewport : Interval3D, surface) -> None:
         axes = self.fig.axes
@@ -44,14 +77,30 @@ class Visualisation3D(Visualisation):
 
         ax.plot_surface(*(surface), cmap=cm.coolwarm, linewidth=0, antialiased=self.antialiasing, zorder=0)
      
-    def plot3DFunction(self, viewport : Interval3D, mesh_grid : Interval2D, mesh_function) -> None:
+    def meshSurface(self, mesh_grid : Interval2D, mesh_function) -> tuple:
         X = np.arange(*mesh_grid.getXInteval())
         Y = np.arange(*mesh_grid.getYInteval())
-        Z = np.array([[mesh_function((x, y)) for x in X] for y in Y])
         
         X, Y = np.meshgrid(X, Y)
+        Z = np.asarray(mesh_function(np.column_stack((X.ravel(), Y.ravel())))).reshape(X.shape)
+
+        return (X, Y, Z)
+
+    def plot3DFunction(self, viewport : Interval3D, mesh_grid : Interval2D, mesh_function, name : str = None) -> None:
+        """
+        mesh_function: evaluates (n, 2) array of points at once, e.g. TestFunction.calculateBatch
+        name: identifies function in surface cache, surface is not cached without it
+        """
+        cached = self.surfaceCache is not None and name is not None
+
+        surface = self.surfaceCache.load(name, viewport, mesh_grid) if cached else None
+        if surface is None:
+            surface = self.meshSurface(mesh_grid, mesh_function)
+
+            if cached:
+                self.surfaceCache.store(name, viewport, mesh_grid, surface)
 
-        self.plotSurface(viewport, (X, Y, Z))
+        self.plotSurface(viewport, surface)
     
     def plotPointsAnimation(self, points, labels = None) -> None:
         axes = self.fig.axes
@@ -1,74 +1,151 @@
 import numpy as np
-import copy
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
 class DifferentialEvolution:
-    def __init__(self, F : float, CR : float) -> None:
+    strategies = ("rand/1/bin", "current-to-pbest/1/bin", "jade", "shade")
+
+    def __init__(self, F : float, CR : float, strategy : str = "rand/1/bin", p : float = 0.1,
+                 archive : bool = True, memory_size : int = 10, learning_rate : float = 0.1) -> None:
+        """
+        strategy: "rand/1/bin" and "current-to-pbest/1/bin" use fixed F and CR,
+                  "jade" and "shade" use current-to-pbest/1/bin and adapt F and CR starting from given values
+        p: fraction of best individuals pbest is chosen from
+        archive: keep replaced targets in external archive used as second difference vector source
+        memory_size: number of success history slots of "shade"
+        learning_rate: adaptation rate of parameter means of "jade"
+        """
+        if strategy not in self.strategies:
+            raise ValueError("Unknown strategy {0}, expected one of {1}".format(strategy, self.strategies))
+
         self.F = F
         self.CR = CR
+        self.strategy = strategy
+        self.p = p
+        self.archive = archive
+        self.memorySize = memory_size
+        self.learningRate = learning_rate
 
     def init(self, seed, function : TestFunction):
         self.seed = seed
         self.function = function
 
-    def evaluatedPopulation(self, population : list[tuple[float, ...]]):
-        return [(*individual, self.function.calculate(individual)) for individual in population]
+    @staticmethod
+    def distinctIndicies(pop_size : int, num_indicies : int) -> np.ndarray:
+        # num_indicies distinct indicies per row, none equal to index of the row
+        indicies = np.argpartition(np.random.random((pop_size, pop_size - 1)), num_indicies - 1, axis=1)[:, :num_indicies]
 
-    def search(self, NP : int, G_maxim : int, max_evaluations : int) -> list:
-        self.function.setSamplingSeed(self.seed)
-        num_dimensions = len(self.function.bounds)
-        num_parents = 3
+        return indicies + (indicies >= np.arange(pop_size)[:, np.newaxis])
 
-        generations = []
-        population = self.function.randomPoints(NP)
-        num_evaluations = 0
-        generations.append(self.evaluatedPopulation(population))
+    def crossover(self, population : np.ndarray, mutation_vectors : np.ndarray, CR) -> np.ndarray:
+        pop_size, num_dimensions = population.shape
 
-        for _ in range(G_maxim):
-            if(num_evaluations >= max_evaluations):
-                return generations
+        mask = np.random.random((pop_size, num_dimensions)) < np.reshape(CR, (-1, 1))
+        mask[np.arange(pop_size), np.random.randint(0, num_dimensions, pop_size)] = True
 
-            new_population = copy.deepcopy(population)
+        return np.where(mask, mutation_vectors, population)
 
-            for individual_index, individual in enumerate(population):
-                parents_indicies = []
-                individual_f_u = self.function.calculate(individual)
-                num_evaluations += 1
+    def currentToPBest(self, population : np.ndarray, fitness : np.ndarray, archive : np.ndarray, F) -> np.ndarray:
+        pop_size = len(population)
+        F = np.reshape(F, (-1, 1))
 
-                for _ in range(num_parents):
-                    index = random.randint(0, len(population) - 1)
+        num_best = max(2, int(round(self.p * pop_size)))
+        pbest = np.argsort(fitness)[np.random.randint(0, num_best, pop_size)]
 
-                    while index in parents_indicies or index == individual_index:
-                        index = random.randint(0, len(population) -1)
+        r1 = self.distinctIndicies(pop_size, 1)[:, 0]
 
-                    parents_indicies.append(index)
+        # second difference vector is drawn from population together with archive
+        union = np.vstack((population, archive))
+        r2 = np.random.randint(0, len(union), pop_size)
+        conflicts = (r2 == np.arange(pop_size)) | (r2 == r1)
+        while np.any(conflicts):
+            r2[conflicts] = np.random.randint(0, len(union), np.count_nonzero(conflicts))
+            conflicts = (r2 == np.arange(pop_size)) | (r2 == r1)
 
-                parents = [population[x] for x in parents_indicies]
+        return population + F * (population[pbest] - population) + F * (population[r1] - union[r2])
 
-                mutation_vector = np.add(self.F * np.subtract(parents[0], parents[1]), parents[2])
-                trial_vector = [0] * num_dimensions
+    @staticmethod
+    def cauchyF(locations : np.ndarray) -> np.ndarray:
+        F = locations + 0.1 * np.random.standard_cauchy(len(locations))
 
-                j_rnd = random.randint(0, num_dimensions - 1)
+        regenerate = F <= 0.0
+        while np.any(regenerate):
+            F[regenerate] = locations[regenerate] + 0.1 * np.random.standard_cauchy(np.count_nonzero(regenerate))
+            regenerate = F <= 0.0
 
-                for j in range(num_dimensions):
-                    if np.random.uniform() < self.CR or j == j_rnd:
-                        trial_vector[j] = mutation_vector[j]
-                    else :
-                        trial_vector[j] = individual[j]
+        return np.minimum(F, 1.0)
 
-                trial_vector = self.function.preserveBoundsLoopAround(trial_vector)
-                f_u = self.function.calculate(trial_vector)
-                num_evaluations += 1
+    @staticmethod
+    def lehmerMean(values : np.ndarray, weights : np.ndarray) -> float:
+        return np.sum(weights * values * values) / np.sum(weights * values)
 
-                if f_u <= individual_f_u:
-                    new_population[individual_index] = trial_vector
-            
-            if(num_evaluations > max_evaluations):
-                return generations
-            
-            population = new_population
-            generations.append(self.evaluatedPopulation(population))
+    def search(self, NP : int, G_maxim : int, max_evaluations : int) -> list:
+        self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
+
+        num_dimensions = len(self.function.bounds)
+        adaptive = self.strategy in ("jade", "shade")
+
+        # success history of "shade", "jade" uses single slot
+        memory_size = self.memorySize if self.strategy == "shade" else 1
+        memory_F = np.full(memory_size, self.F)
+        memory_CR = np.full(memory_size, self.CR)
+        memory_index = 0
+
+        archive = np.empty((0, num_dimensions))
+
+        generations = []
 
-        return generations
\ No newline at end of file
+        try:
+            population, fitness = self.counter.randomSamplesArray(NP)
+            generations.append(np.column_stack((population, fitness)))
+
+            for _ in range(G_maxim):
+                if adaptive:
+                    slots = np.random.randint(0, memory_size, NP)
+                    F = self.cauchyF(memory_F[slots])
+                    CR = np.clip(np.random.normal(memory_CR[slots], 0.1), 0.0, 1.0)
+                else:
+                    F = np.full(NP, self.F)
+                    CR = np.full(NP, self.CR)
+
+                if self.strategy == "rand/1/bin":
+                    parents = self.distinctIndicies(NP, 3)
+                    mutation_vectors = population[parents[:, 0]] + F[:, np.newaxis] * (population[parents[:, 1]] - population[parents[:, 2]])
+                else:
+                    mutation_vectors = self.currentToPBest(population, fitness, archive, F)
+
+                trial_vectors = self.function.preserveBoundsLoopAroundBatch(self.crossover(population, mutation_vectors, CR))
+                trial_fitness = self.counter.calculateBatch(trial_vectors)
+
+                improved = trial_fitness <= fitness
+                succeeded = trial_fitness < fitness
+
+                if self.archive and self.strategy != "rand/1/bin":
+                    archive = np.vstack((archive, population[succeeded]))
+                    if len(archive) > NP:
+                        archive = archive[np.random.permutation(len(archive))[:NP]]
+
+                if adaptive and np.any(succeeded):
+                    improvements = fitness[succeeded] - trial_fitness[succeeded]
+                    weights = improvements / np.sum(improvements)
+
+                    if self.strategy == "shade":
+                        memory_F[memory_index] = self.lehmerMean(F[succeeded], weights)
+                        memory_CR[memory_index] = np.sum(weights * CR[succeeded])
+                        memory_index = (memory_index + 1) % memory_size
+                    else:
+                        c = self.learningRate
+                        memory_F[0] = (1.0 - c) * memory_F[0] + c * self.lehmerMean(F[succeeded], np.ones(np.count_nonzero(succeeded)))
+                        memory_CR[0] = (1.0 - c) * memory_CR[0] + c * np.mean(CR[succeeded])
+
+                population = np.where(improved[:, np.newaxis], trial_vectors, population)
+                fitness = np.where(improved, trial_fitness, fitness)
+
+                generations.append(np.column_stack((population, fitness)))
+        except EvaluationBudgetExhausted:
+            pass
+
+        return generations
@@ -1,108 +1,108 @@
 import numpy as np
-import copy
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
+from common.spatial import *
 
+class FireflySwarmp:
+    def __init__(self, noise : float = 0.3, k_nearest : int = None, search_radius : int = 1) -> None:
+        """
+        noise: standard deviation of random movement made with every move of a firefly
+        k_nearest: fireflies are attracted only to their k nearest brighter fireflies found through grid index, all pairs when None
+        search_radius: rings of grid cells searched for nearest brighter fireflies, None for exact search
+        """
+        self.noise = noise
+        self.kNearest = k_nearest
+        self.searchRadius = search_radius
 
-class Firefly:
-    def __init__(self, position : tuple[float, ...], evaluation : float, function : TestFunction) -> None:
-        self.position = position
-        self.brightness = 1.0 / evaluation
-        self.evaluation = evaluation
+    def init(self, seed, function : TestFunction):
+        self.seed = seed
         self.function = function
 
-    def setEvaluation(self, evaluation : float) -> None:
-        self.evaluation = evaluation
-        self.brightness = 1.0 / evaluation
+    def createGenData(self, positions : np.ndarray, evaluations : np.ndarray) -> np.ndarray:
+        return np.column_stack((positions, evaluations))
 
-    def distance(self, other):
-        return np.sqrt(np.sum(np.power(np.subtract(self.position, other.position), 2.0)))
+    def attractionFactors(self, positions : np.ndarray, evaluations : np.ndarray) -> np.ndarray:
+        # pairwise distances from |a|^2 + |b|^2 - 2ab, clipped against rounding below zero
+        squared_norms = np.sum(positions * positions, axis=1)
+        squared_distances = squared_norms[:, np.newaxis] + squared_norms[np.newaxis, :] - 2.0 * positions @ positions.T
+        distances = np.sqrt(np.maximum(squared_distances, 0.0))
 
-    def moveRandom(self):
-        num_dims = len(self.position)
+        brighter = evaluations[np.newaxis, :] < evaluations[:, np.newaxis]
 
-        random_movement = np.clip(np.random.normal(0.0, 0.3, num_dims), (-1.0) * num_dims, (1.0) * num_dims)
-        new_position = self.function.preserveBoundsSetAtBorder(np.add(self.position, random_movement))
-        eval = self.function.calculate(new_position)
+        return np.where(brighter, 1.0 / (1.0 + distances), 0.0)
 
-        if eval < self.evaluation:
-            self.position = new_position
-            self.evaluation = eval
+    # Factors toward k nearest brighter fireflies as (n, k) arrays of factors and neighbor indicies sorted by index,
+    # missing neighbors have index -1 and factor 0
+    def nearestAttractionFactors(self, positions : np.ndarray, evaluations : np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        index = GridIndex(positions, grid_dims=3)
+        neighbors, distances = index.nearest(self.kNearest, lambda rows, candidates: evaluations[candidates][np.newaxis, :] < evaluations[rows][:, np.newaxis],
+                                             self.searchRadius)
 
-    def moveToward(self, other):
-        if other == self:
-            return
-        
-        num_dims = len(self.position)
+        order = np.argsort(np.where(neighbors < 0, len(positions), neighbors), axis=1)
+        neighbors = np.take_along_axis(neighbors, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
 
-        random_movement = np.clip(np.random.normal(0.0, 0.3, num_dims), (-1.0) * num_dims, (1.0) * num_dims)
-            
-        if self.evaluation > other.evaluation:
-            attractiveness = 1 / (1 + self.distance(other))
-            attract = np.add(self.position, np.multiply(np.subtract(other.position, self.position), attractiveness))
-            new_position = self.function.preserveBoundsSetAtBorder(np.add(attract, random_movement))
-        else:
-            new_position = self.function.preserveBoundsSetAtBorder(np.add(self.position, random_movement))
+        return np.where(neighbors < 0, 0.0, 1.0 / (1.0 + distances)), neighbors
 
-        self.position = new_position
-        #self.reevaluate()
+    # Moves firefly i toward every brighter firefly j in order of j, each move goes attractiveness of j
+    # closer to it and adds random movement. Result of the whole sequence is computed at once from
+    # products of (1 - attractiveness) of the moves that follow each move.
+    def moveSwarm(self, positions : np.ndarray, factors : np.ndarray, neighbors : np.ndarray = None) -> np.ndarray:
+        num_fireflies = len(positions)
 
-    def reevaluate(self):
-        self.evaluation = self.function.calculate(self.position)
-        self.brightness = 1.0 / self.evaluation
+        remaining = np.cumprod((1.0 - factors)[:, ::-1], axis=1)[:, ::-1]
+        following = np.column_stack((remaining[:, 1:], np.ones(num_fireflies)))
 
-class FireflySwarmp:
-    def init(self, seed, function : TestFunction):
-        self.seed = seed
-        self.function = function
+        if neighbors is None:
+            attracted = positions * remaining[:, :1] + (factors * following) @ positions
+
+            # moves toward itself are skipped
+            np.fill_diagonal(following, 0.0)
+        else:
+            attracted = positions * remaining[:, :1] + np.einsum("nk,nkd->nd", factors * following, positions[neighbors])
+
+            # only moves toward found neighbors are made
+            following = np.where(neighbors < 0, 0.0, following)
 
-    def createGenData(self, population : list[Firefly]):
-        data = []
+        # random movements of all moves sum to one normal movement
+        noise_scale = self.noise * np.sqrt(np.sum(following * following, axis=1))
 
-        for individual in population:
-            data.append((*individual.position, individual.evaluation))
-    
-        return data
+        return attracted + noise_scale[:, np.newaxis] * np.random.normal(0.0, 1.0, positions.shape)
 
     def search(self, popSize : int, M_max : int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
 
-        num_evaluations = popSize
         generations = []
-        population = [Firefly(sample[:-1], sample[-1], self.function) for sample in self.function.randomSamples(popSize)]
-        generations.append(self.createGenData(population))
-
-        leader = population[0]
-        for individual in population:
-            if individual.evaluation < leader.evaluation:
-                leader = individual
-
-        for p in range(M_max):
-            for individual1 in population:
-                if individual1.evaluation == leader.evaluation:
-                    individual1.moveRandom()
-                    num_evaluations += 1
-                    continue
-
-                for individual2 in population:
-                    individual1.moveToward(individual2)
-                    #num_evaluations += 1
-            
-            population[0].reevaluate()
-            new_leader = population[0]
-            num_evaluations += 1
-
-            for individual in population:
-                individual.reevaluate()
-                num_evaluations += 1
-                if individual.evaluation < new_leader.evaluation:
-                    new_leader = individual
-
-            leader = new_leader
-            if num_evaluations > max_evaluations:
-                return generations
-
-            generations.append(self.createGenData(population))
-
-        return generations
\ No newline at end of file
+
+        try:
+            positions, evaluations = self.counter.randomSamplesArray(popSize)
+            generations.append(self.createGenData(positions, evaluations))
+
+            for _ in range(M_max):
+                if self.kNearest is None:
+                    leaders = evaluations == np.min(evaluations)
+                    new_positions = self.moveSwarm(positions, self.attractionFactors(positions, evaluations))
+                else:
+                    # fireflies without brighter neighbor nearby lead their surroundings
+                    factors, neighbors = self.nearestAttractionFactors(positions, evaluations)
+                    leaders = np.all(neighbors < 0, axis=1)
+                    new_positions = self.moveSwarm(positions, factors, neighbors)
+
+                # leaders only move randomly and stay if the move does not improve them
+                new_positions[leaders] = positions[leaders] + np.random.normal(0.0, self.noise, (np.count_nonzero(leaders), positions.shape[1]))
+                new_positions = self.function.preserveBoundsSetAtBorderBatch(new_positions)
+
+                new_evaluations = self.counter.calculateBatch(new_positions)
+
+                stay = leaders & (new_evaluations >= evaluations)
+                positions = np.where(stay[:, np.newaxis], positions, new_positions)
+                evaluations = np.where(stay, evaluations, new_evaluations)
+
+                generations.append(self.createGenData(positions, evaluations))
+        except EvaluationBudgetExhausted:
+            pass
+
+        return generations
@@ -3,49 +3,64 @@ import random
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
-class HillClimbingSearch3D:
-    def init(self, seed, function : TestFunction, deviation : float):
+class HillClimbingSearch:
+    def __init__(self, deviation : float) -> None:
+        self.sigma = deviation
+
+    def init(self, seed, function : TestFunction):
         self.seed = seed
         self.function = function
-        self.sigma = deviation
 
-    def search(self, num_samples, num_generations):
+    def search(self, num_samples : int, num_generations : int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
+
+        generations = []
 
-        best_solutions = []
-        best_solutions_labels = []
+        # improvements of best solution as (d + 1) rows with labels
+        self.bestSolutions = []
+        self.bestSolutionsLabels = []
 
-        #1) first sample
-        best_solution = self.function.randomSample()
-        best_solutions.append(best_solution)
-        best_solutions_labels.append("gen 0")
+        try:
+            #1) first samples
+            samples, evaluations = self.counter.randomSamplesArray(num_samples)
+            generations.append(np.column_stack((samples, evaluations)))
 
-        #2) generations
-        for gen_number in range(1, num_generations + 1):
-            samples = self.function.normalSamples(best_solution[:2], self.sigma, num_samples)
+            best_index = np.argmin(evaluations)
+            best_solution, best_evaluation = samples[best_index], evaluations[best_index]
+            self.bestSolutions.append((*best_solution, best_evaluation))
+            self.bestSolutionsLabels.append("gen 0")
 
-            # select first sample
-            best_gen_solution = samples[0]
+            #2) generations sampled around best solution
+            for gen_number in range(1, num_generations + 1):
+                samples, evaluations = self.counter.normalSamplesArray(best_solution, self.sigma, num_samples)
+                generations.append(np.column_stack((samples, evaluations)))
 
-            # compare with rest of samples
-            for sample in samples[1:]:
-                if sample[2] < best_gen_solution[0]:
-                    best_gen_solution = sample
+                best_index = np.argmin(evaluations)
+                if evaluations[best_index] < best_evaluation:
+                    best_solution, best_evaluation = samples[best_index], evaluations[best_index]
+                    self.bestSolutions.append((*best_solution, best_evaluation))
+                    self.bestSolutionsLabels.append("gen {0}".format(gen_number))
+        except EvaluationBudgetExhausted:
+            pass
 
-            # compare gen's best with overall best
-            if best_gen_solution[2] < best_solution[2]:
-                best_solution = best_gen_solution
-                best_solutions.append(best_solution)
-                best_solutions_labels.append("gen {0}".format(gen_number))
+        return generations
 
-        resultX = []
-        resultY = []
-        resultZ = []
+class HillClimbingSearch3D(HillClimbingSearch):
+    def __init__(self) -> None:
+        super().__init__(None)
+
+    def init(self, seed, function : TestFunction, deviation : float):
+        super().init(seed, function)
+        self.sigma = deviation
+
+    def search(self, num_samples, num_generations):
+        super().search(num_samples, num_generations, None)
 
-        for point in best_solutions:
-            resultX.append(point[0])
-            resultY.append(point[1])
-            resultZ.append(point[2])
+        resultX = [point[0] for point in self.bestSolutions]
+        resultY = [point[1] for point in self.bestSolutions]
+        resultZ = [point[2] for point in self.bestSolutions]
 
-        return (resultX, resultY, resultZ, best_solutions_labels) 
\ No newline at end of file
+        return (resultX, resultY, resultZ, self.bestSolutionsLabels) 
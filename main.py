@@ -10,24 +10,29 @@ import firefly as ff
 import tlbo as tl
 
 import datetime
+import time
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
 import csv
 
+surface_cache = SurfaceCache("surface_cache")
+registry = FunctionRegistry()
+
 def testAlgo(seed : float, deviation : float, visualResolution : int, algo, searchParams, displayLabels=False):
     print("current seed:", seed)
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
         algo.init(seed, function, deviation)
         X, Y, Z, labels = algo.search(*searchParams)
 
         print("best: ", (labels[-1], X[-1], Y[-1], Z[-1]))
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(visualResolution), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(visualResolution), function.calculateBatch, name)
         visual.plotPointsAnimation((X, Y, Z), labels if displayLabels else None)
 
         visual.show()
@@ -78,12 +83,12 @@ def test_tsp():
     algo = ga.TSPGA(points_list)
     last_gen, gen_data = algo.run(num_generations, num_individuals, seed)
 
-    sorted_generation = sorted(last_gen, key= lambda x : x.getPathLength())
-    path_points = ([points[0][x] for x in sorted_generation[0].getPath()[:-1]],
-                   [points[1][y] for y in sorted_generation[0].getPath()[:-1]])
+    best_path = last_gen.getPath(np.argmin(last_gen.pathLengths))
+    path_points = ([points[0][x] for x in best_path[:-1]],
+                   [points[1][y] for y in best_path[:-1]])
 
-    # for individual in sorted_generation:
-    #     print(individual.getPath(), individual.getPathLength())
+    # for index in np.argsort(last_gen.pathLengths):
+    #     print(last_gen.getPath(index), last_gen.getPathLength(index))
 
     visual = Visualisation2D()
     visual.plotLine([x["min"] for x in gen_data], "Distance")
@@ -115,15 +120,15 @@ def test_diff_evolution():
     num_individuals = 30
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
 
         algo = de.DifferentialEvolution()
         algo.init(seed, function)
 
         result = algo.search(num_individuals, num_generations, 0.5, 0.5, 3000)
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculateBatch, name)
         visual.plotGenerationsAnimation([createPopulationVisual(gen) for gen in result])
 
         visual.show()
@@ -134,8 +139,8 @@ def test_pso():
     num_individuals = 50
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
 
         algo = pso.ParticleSwarm(c1=2.0, c2=2.0, vmaxi_coef=0.02, vmini_coef=0.001,
                              ws=0.9, we=0.4)
@@ -143,7 +148,7 @@ def test_pso():
 
         result = algo.search(pop_size=num_individuals, M_max=num_generations, max_evaluations=3000)
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculateBatch, name)
         visual.plotGenerationsAnimation([createPopulationVisual(gen) for gen in result])
 
         visual.show()
@@ -157,15 +162,15 @@ def test_soma():
     step = 0.11
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
 
         algo = soma.SomaA2O(PRT, pathLength, step)
         algo.init(seed, function)
 
         result = algo.search(num_individuals, num_generations, 3000)
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculateBatch, name)
         visual.plotGenerationsAnimation([createPopulationVisual(gen) for gen in result])
 
         visual.show()
@@ -217,15 +222,15 @@ def test_firefly():
     num_individuals = 20
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
 
         algo = ff.FireflySwarmp()
         algo.init(seed, function)
 
         result = algo.search(num_individuals, num_generations, 3000)
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculateBatch, name)
         visual.plotGenerationsAnimation([createPopulationVisual(gen) for gen in result])
 
         visual.show()
@@ -236,46 +241,103 @@ def test_tlbo():
     num_individuals = 20
 
     functions = Functions3D() 
-    for _, function in functions.__dict__.items():
-        visual = Visualisation3D()
+    for name, function in functions.__dict__.items():
+        visual = Visualisation3D(surface_cache=surface_cache)
 
         algo = tl.TLBO()
         algo.init(seed, function)
 
         result = algo.search(num_individuals, num_generations, 3000)
 
-        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculate)
+        visual.plot3DFunction(function.viewPort, function.meshInterval(30), function.calculateBatch, name)
         visual.plotGenerationsAnimation([createPopulationVisual(gen) for gen in result])
 
         visual.show()
 
-#test_blind_search()
-#test_hill_climbing()
-#test_annealing()
-#test_tsp()
-#test_diff_evolution()
-#test_pso()
-#test_soma()
-#test_tsp_aco()
-#test_firefly()
-test_tlbo()
+def test_parallel_evaluation():
+    seed = 59794
+    num_generations = 10
+    num_individuals = 50
+
+    algorithms = [de.DifferentialEvolution(0.5, 0.5),
+                  pso.ParticleSwarm(c1=2.0, c2=2.0, vmaxi_coef=0.1, vmini_coef=0.001, ws=0.9, we=0.4),
+                  soma.SomaA2O(0.4, 3.0, 0.11),
+                  ff.FireflySwarmp(),
+                  tl.TLBO()]
+
+    with ParallelFunction(SlowSphere(30)) as parallel_function:
+        for algo in algorithms:
+            for function in (SlowSphere(30), parallel_function):
+                algo.init(seed, function)
+
+                start = time.perf_counter()
+                result = algo.search(num_individuals, num_generations, 3000)
+                duration = time.perf_counter() - start
+
+                best = min(min(gen, key=lambda x : x[-1])[-1] for gen in result)
+                print(type(algo).__name__, type(function).__name__, "{0:.2f} s".format(duration), best)
+
+def test_de_strategies():
+    num_repetitions = 5
+    num_generations = 1000
+    num_individuals = 50
+    max_evaluations = 30000
+    num_dimensions = 30
+    targets = {"rosenbrock": 100.0, "schwefel": 3000.0}
+
+    for name, target in targets.items():
+        function = registry.get(name, num_dimensions)
 
+        for strategy in de.DifferentialEvolution.strategies:
+            algo = de.DifferentialEvolution(0.5, 0.5, strategy)
+            evaluations_to_target = []
 
-def experiment(algo, num_repetitions, num_generations, num_individuals, num_evaluations, num_dimensions):
+            for seed in range(num_repetitions):
+                algo.init(seed, function)
+                algo.search(num_individuals, num_generations, max_evaluations)
+
+                evaluations_to_target.append(algo.counter.getEvaluationsToTarget(target))
+
+            print(name, strategy, "evaluations to {0}:".format(target), evaluations_to_target)
+
+def test_roulette_selection():
+    np.random.seed(59794)
+    num_draws = 20000
+
+    # rows with totals far below totals of previous rows keep their own probabilities
+    for weights, expected in (([[1e20, 1.0], [1e-3, 1e-3]], [0.5, 0.5]),
+                              ([[1.0, 1.0, 1.0, 1.0], [1e-300, 0.0, 0.0, 1e-300]], [0.5, 0.0, 0.0, 0.5])):
+        weights = np.array(weights)
+        columns = np.array([aco.TSPACO.rouletteSelection(weights)[-1] for _ in range(num_draws)])
+        frequencies = np.bincount(columns, minlength=weights.shape[1]) / num_draws
+
+        print(weights[-1], frequencies)
+        assert np.allclose(frequencies, expected, atol=0.02)
+
+def experiment(algo, num_repetitions, num_generations, num_individuals, num_evaluations, num_dimensions, evaluation_counts=None):
+    """
+    evaluation_counts: optional list, receives per repetition dict of evaluations spent on each function
+    """
     def runAlgo(algo, num_generations, num_individuals, num_evaluations, num_dimensions):
-        functions = Functions(num_dimensions)
+        functions = registry.getAll(num_dimensions)
         results = {}
-        for name, function in functions.__dict__.items():
+        counts = {}
+        for name, function in functions.items():
             algo.init(None, function)
             result =  algo.search(num_individuals, num_generations, num_evaluations)
 
             results[name] = result
+            counts[name] = algo.counter.getEvaluations()
         
-        return results
+        return results, counts
     
     runs = []
     for _ in range(num_repetitions):
-        runs.append(runAlgo(algo, num_generations, num_individuals, num_evaluations, num_dimensions))
+        results, counts = runAlgo(algo, num_generations, num_individuals, num_evaluations, num_dimensions)
+        runs.append(results)
+
+        if evaluation_counts is not None:
+            evaluation_counts.append(counts)
 
     return runs
 
@@ -308,25 +370,51 @@ def writeResults(results, per_experiment):
 
             per_exp_writer.writerow(per_experiment_data)
 
-# results = experiment(de.DifferentialEvolution(0.5, 0.5), 30, 30, 30, 3000, 30)
-# writeResults(results, "de.csv")
-# plotExperiment(results[0])
-
-# results = experiment(soma.SomaA2O(0.4, 3.0, 0.11), 30, 30, 30, 3000, 30)
-# writeResults(results, "soma.csv")
-# plotExperiment(results[0])
-
-# results = experiment(pso.ParticleSwarm(c1=2.0, c2=2.0, vmaxi_coef=0.1, vmini_coef=0.001,
-#                              ws=0.9, we=0.4), 30, 30, 30, 3000, 30)
-# writeResults(results, "pso.csv")
-# plotExperiment(results[0])
-
-# results = experiment(ff.FireflySwarmp(), 30, 30, 30, 3000, 30)
-# writeResults(results, "firefly.csv")
-# plotExperiment(results[0])
-
-# results = experiment(tl.TLBO(), 30, 30, 30, 3000, 30)
-# writeResults(results, "tlbo.csv")
-# plotExperiment(results[0])
-
-pass
\ No newline at end of file
+if __name__ == "__main__":
+    #test_blind_search()
+    #test_hill_climbing()
+    #test_annealing()
+    #test_tsp()
+    #test_diff_evolution()
+    #test_pso()
+    #test_soma()
+    #test_tsp_aco()
+    #test_firefly()
+    test_tlbo()
+    #test_parallel_evaluation()
+    #test_de_strategies()
+    #test_roulette_selection()
+
+    # results = experiment(bs.BlindSearch(), 30, 100, 30, 3000, 30)
+    # writeResults(results, "blind.csv")
+
+    # results = experiment(hc.HillClimbingSearch(0.02), 30, 100, 30, 3000, 30)
+    # writeResults(results, "hillclimbing.csv")
+
+    # results = experiment(an.SimulatedAnnealing(0.02, 200.0, 0.1, 0.9, tempering=True), 30, 100, 30, 3000, 30)
+    # writeResults(results, "tempering.csv")
+
+    # results = experiment(de.DifferentialEvolution(0.5, 0.5), 30, 30, 30, 3000, 30)
+    # writeResults(results, "de.csv")
+    # plotExperiment(results[0])
+
+    # results = experiment(soma.SomaA2O(0.4, 3.0, 0.11), 30, 30, 30, 3000, 30)
+    # writeResults(results, "soma.csv")
+    # plotExperiment(results[0])
+
+    # results = experiment(soma.SomaT3A(), 30, 30, 30, 3000, 30)
+    # writeResults(results, "somat3a.csv")
+    # plotExperiment(results[0])
+
+    # results = experiment(pso.ParticleSwarm(c1=2.0, c2=2.0, vmaxi_coef=0.1, vmini_coef=0.001,
+    #                              ws=0.9, we=0.4), 30, 30, 30, 3000, 30)
+    # writeResults(results, "pso.csv")
+    # plotExperiment(results[0])
+
+    # results = experiment(ff.FireflySwarmp(), 30, 30, 30, 3000, 30)
+    # writeResults(results, "firefly.csv")
+    # plotExperiment(results[0])
+
+    # results = experiment(tl.TLBO(), 30, 30, 30, 3000, 30)
+    # writeResults(results, "tlbo.csv")
+    # plotExperiment(results[0])
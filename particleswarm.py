@@ -1,84 +1,117 @@
 import numpy as np
-import copy
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
-class Particle:
-    def __init__(self, position, initial_velocity, initial_evaluation) -> None:
-        self.position = position
-        self.velocity = initial_velocity
-        self.evaluation = initial_evaluation
-        self.bestPosition = position
-        self.bestEvaluation = initial_evaluation
-
-    def update(self, function : TestFunction) -> None:
-        self.position = function.preserveBoundsSetAtBorder(np.add(self.position, self.velocity))
-
-        self.evaluation = function.calculate(self.position)
-        if self.evaluation < self.bestEvaluation:
-            self.bestEvaluation = self.evaluation
-            self.bestPosition = self.position
-           
-    def setVelocity(self, velocity) -> None:
-        self.velocity = copy.copy(velocity)
-
-    def getVelocity(self):
-        return self.velocity
-    
-    def getBestPosition(self):
-        return self.bestPosition
-    
-    def __repr__(self) -> str:
-        return "({0},{1}) {2}".format(*self.position, self.evaluation)
+topologies = ("gbest", "ring", "von-neumann", "random-k")
 
+# Neighbor indicies of every particle as (n, k) array including the particle itself, None for gbest
+def topologyNeighbors(topology : str, num_individuals : int, k : int = 3) -> np.ndarray:
+    indicies = np.arange(num_individuals)
+
+    if topology == "gbest":
+        return None
+    elif topology == "ring":
+        return np.column_stack(((indicies - 1) % num_individuals, indicies, (indicies + 1) % num_individuals))
+    elif topology == "von-neumann":
+        # toroidal grid filled row by row, last row may be partial
+        columns = int(np.ceil(np.sqrt(num_individuals)))
+        num_rows = int(np.ceil(num_individuals / columns))
+        last_row_length = num_individuals - (num_rows - 1) * columns
+
+        rows, cols = np.divmod(indicies, columns)
+        row_lengths = np.where(rows == num_rows - 1, last_row_length, columns)
+
+        def vertical(step : int) -> np.ndarray:
+            # column missing in partial last row is skipped over to the next row in the same direction
+            target_rows = (rows + step) % num_rows
+            missing = (target_rows == num_rows - 1) & (cols >= last_row_length)
+            target_rows = np.where(missing, (target_rows + step) % num_rows, target_rows)
+
+            return target_rows * columns + cols
+
+        return np.column_stack((indicies, rows * columns + (cols - 1) % row_lengths, rows * columns + (cols + 1) % row_lengths,
+                                vertical(-1), vertical(1)))
+    elif topology == "random-k":
+        informants = np.random.randint(0, num_individuals, (num_individuals, k))
+
+        return np.column_stack((indicies, informants))
+
+    raise ValueError("Unknown topology {0}, expected one of {1}".format(topology, topologies))
+
+# Struct of arrays swarm, row i of each array belongs to particle i
 class Swarm:
-    def __init__(self, searchSpace : TestFunction, num_individuals : int, v_mini, v_maxi) -> None:
+    def __init__(self, searchSpace : TestFunction, num_individuals : int, v_mini, v_maxi, topology : str = "gbest", k : int = 3) -> None:
         velocity_difference = np.subtract(v_mini, v_maxi)
 
-        initial_partcle_positions = searchSpace.randomPoints(num_individuals)
-        initial_velocities = [np.add(v_mini, np.multiply(velocity_difference, coef)) for coef in np.random.random(num_individuals)]
+        self.positions = searchSpace.randomPositions(num_individuals)
+        self.velocities = v_mini + velocity_difference * np.random.random((num_individuals, 1))
+        self.evaluations = searchSpace.calculateBatch(self.positions)
+
+        self.bestPositions = self.positions.copy()
+        self.bestEvaluations = self.evaluations.copy()
+        self.bestGlobalIndex = int(np.argmin(self.bestEvaluations))
 
-        self.particles = [Particle(initial_partcle_positions[pi], initial_velocities[pi], searchSpace.calculate(initial_partcle_positions[pi]) ) for pi in range(num_individuals)]
         self.searchSpace = searchSpace
         self.vMini = v_mini
         self.vMaxi = v_maxi
-        self.bestGlobalParticle = copy.deepcopy(self.particles[0])
-        self.num_evaluations = num_individuals
 
-    def findBestIndividual(self) -> Particle:
-        best_particle = self.particles[0]
+        self.topology = topology
+        self.k = k
+        self.neighbors = topologyNeighbors(topology, num_individuals, k)
 
-        for particle in self.particles:
-            if best_particle.evaluation > particle.evaluation:
-                best_particle = particle
+    def getBestGlobalPosition(self) -> np.ndarray:
+        return self.bestPositions[self.bestGlobalIndex]
 
-        return best_particle
+    def getBestGlobalEvaluation(self) -> float:
+        return self.bestEvaluations[self.bestGlobalIndex]
+
+    def getNeighborhoodBestPositions(self) -> np.ndarray:
+        if self.neighbors is None:
+            return self.getBestGlobalPosition()
+
+        best_neighbor = np.argmin(self.bestEvaluations[self.neighbors], axis=1)
+
+        return self.bestPositions[self.neighbors[np.arange(len(self.neighbors)), best_neighbor]]
 
     def update(self, inertia_weight : float, c1 : float, c2: float):
-        for particle in self.particles:
-            r1 = np.random.uniform()
+        r1 = np.random.random((len(self.positions), 1))
+
+        inertia_velocity = inertia_weight * self.velocities
+        position_learning = r1 * c1 * (self.bestPositions - self.positions)
+        global_learning = r1 * c2 * (self.getNeighborhoodBestPositions() - self.positions)
 
-            inertia_velocity = np.multiply(inertia_weight, particle.getVelocity())
-            position_learning = r1 * c1 * np.subtract(particle.bestPosition, particle.position)
-            global_learning = r1 * c2 * np.subtract(self.bestGlobalParticle.position, particle.position)
+        new_velocities = inertia_velocity + position_learning + global_learning
 
-            new_velocity = inertia_velocity +  position_learning + global_learning
-            abs_velocity = np.abs(new_velocity)
+        # speed of every component is kept between v_mini and v_maxi, zero components stay zero
+        self.velocities = np.clip(np.abs(new_velocities), self.vMini, self.vMaxi) * np.sign(new_velocities)
+        self.positions = self.searchSpace.preserveBoundsSetAtBorderBatch(self.positions + self.velocities)
+        self.evaluations = self.searchSpace.calculateBatch(self.positions)
 
-            new_velocity = np.multiply(np.clip(abs_velocity, self.vMini, self.vMaxi), np.divide(new_velocity, abs_velocity))
+        improved = self.evaluations < self.bestEvaluations
+        self.bestPositions[improved] = self.positions[improved]
+        self.bestEvaluations[improved] = self.evaluations[improved]
 
-            particle.setVelocity(new_velocity)
-            particle.update(self.searchSpace)
-            self.num_evaluations += 1
+        previous_best = self.getBestGlobalEvaluation()
+        self.bestGlobalIndex = int(np.argmin(self.bestEvaluations))
 
-        gen_best = self.findBestIndividual()
-        if gen_best.evaluation < self.bestGlobalParticle.evaluation:
-            self.bestGlobalParticle = copy.deepcopy(gen_best)
+        # random informants are redrawn when the swarm stops improving
+        if self.topology == "random-k" and not self.getBestGlobalEvaluation() < previous_best:
+            self.neighbors = topologyNeighbors(self.topology, len(self.positions), self.k)
 
 class ParticleSwarm:
     def __init__(self, c1 : float, 
-               c2 :float, vmini_coef : float, vmaxi_coef : float, ws : float, we : float) -> None:
+               c2 :float, vmini_coef : float, vmaxi_coef : float, ws : float, we : float, topology : str = "gbest", k : int = 3) -> None:
+        """
+        topology: "gbest", "ring", "von-neumann" or "random-k", particles learn from best personal best of their neighborhood
+        k: number of random informants of every particle in "random-k" topology
+        """
+        if topology not in topologies:
+            raise ValueError("Unknown topology {0}, expected one of {1}".format(topology, topologies))
+
+        self.topology = topology
+        self.k = k
         self.c1 = c1
         self.c2 = c2
         self.vmini_coef = vmini_coef
@@ -90,33 +123,28 @@ class ParticleSwarm:
         self.seed = seed
         self.function = function
 
-    def createGenData(self, population : Swarm):
-        data = []
-
-        for individual in population.particles:
-            position = individual.position
-            data.append((*position, individual.evaluation))
-            
-        return data
+    def createGenData(self, population : Swarm) -> np.ndarray:
+        return np.column_stack((population.positions, population.evaluations))
 
     def search(self, pop_size : int, M_max : int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
 
         vmini = np.multiply(self.vmini_coef, self.function.scales)
         vmaxi = np.multiply(self.vmaxi_coef, self.function.scales)
 
         generations = []
-        
-        population = Swarm(self.function, pop_size, vmini, vmaxi)
-        generations.append(self.createGenData(population))
-
-        for i in range(M_max):
-            inertia_weight = self.ws - ((self.ws - self.we) * float(i)) / float(M_max)
 
-            population.update(inertia_weight, self.c1, self.c2)
-            if population.num_evaluations > max_evaluations:
-                return generations
-            
+        try:
+            population = Swarm(self.counter, pop_size, vmini, vmaxi, self.topology, self.k)
             generations.append(self.createGenData(population))
 
+            for i in range(M_max):
+                inertia_weight = self.ws - ((self.ws - self.we) * float(i)) / float(M_max)
+
+                population.update(inertia_weight, self.c1, self.c2)
+                generations.append(self.createGenData(population))
+        except EvaluationBudgetExhausted:
+            pass
+
         return generations
\ No newline at end of file
@@ -1,8 +1,29 @@
 import numpy as np
-import copy
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
+
+# Moves every migrant along its path toward its leader, migrant takes the best path position if it improves
+def migrate(function : TestFunction, migrants : np.ndarray, fitness : np.ndarray, leaders : np.ndarray,
+            steps : np.ndarray, PRT : float) -> tuple[np.ndarray, np.ndarray]:
+    num_migrants, num_dimensions = migrants.shape
+
+    # path positions of all migrants as (migrants, steps, d) array, PRT mask drawn for every step
+    prt_masks = np.random.random((num_migrants, len(steps), num_dimensions)) < PRT
+    paths = migrants[:, np.newaxis, :] + (leaders - migrants)[:, np.newaxis, :] * steps[np.newaxis, :, np.newaxis] * prt_masks
+    paths = function.preserveBoundsSetAtBorderBatch(paths)
+
+    path_fitness = function.calculateBatch(paths.reshape(-1, num_dimensions)).reshape(num_migrants, len(steps))
+
+    best_steps = np.argmin(path_fitness, axis=1)
+    best_fitness = path_fitness[np.arange(num_migrants), best_steps]
+    improved = best_fitness < fitness
+
+    new_migrants = np.where(improved[:, np.newaxis], paths[np.arange(num_migrants), best_steps], migrants)
+    new_fitness = np.where(improved, best_fitness, fitness)
+
+    return new_migrants, new_fitness
 
 class SomaA2O:
     def __init__(self, PRT : float, pathLength: float, step : float) -> None:
@@ -16,47 +37,133 @@ class SomaA2O:
 
     def search(self, popSize : int, M_max :int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
 
         generations = []
-        population = self.function.randomSamples(popSize)
-        generations.append(population)
 
-        num_evaluations = popSize
+        try:
+            population, fitness = self.counter.randomSamplesArray(popSize)
+            generations.append(np.column_stack((population, fitness)))
+
+            leader = population[np.argmin(fitness)]
+            steps = np.arange(0.0, self.pathLength, self.step)
+
+            for _ in range(M_max):
+                population, fitness = migrate(self.counter, population, fitness, leader, steps, self.PRT)
+                leader = population[np.argmin(fitness)]
+
+                generations.append(np.column_stack((population, fitness)))
+        except EvaluationBudgetExhausted:
+            pass
 
-        leader = population[0]
-        for individual in population:
-            if individual[-1] < leader[-1]:
-                leader = copy.copy(individual)
+        return generations
+
+# Each individual migrates toward every other one in turn and moves right after each of them,
+# migration ends early when the rest of the budget can not pay for next leader
+class SomaAllToAllAdaptive:
+    def __init__(self, PRT : float, pathLength: float, step : float) -> None:
+        self.PRT = PRT
+        self.pathLength = pathLength
+        self.step = step
+
+    def init(self, seed, function : TestFunction):
+        self.seed = seed
+        self.function = function
 
-        for _ in range(M_max):
-            new_population = []
-            new_leader = leader
-            for  individual in population:
-                best_individual = individual
-                new_individual = [0] * len(individual)
+    def budgetExhausted(self, migration_cost : int) -> bool:
+        remaining = self.counter.getRemaining()
 
-                for t in np.arange(0.0, self.pathLength, self.step):
-                    for i in range(len(self.function.bounds)):
-                      new_individual[i] = individual[i] + (leader[i] - individual[i]) * t * (1.0 if np.random.rand() < self.PRT else 0.0)
+        return remaining is not None and remaining < migration_cost
+
+    def search(self, popSize : int, M_max :int, max_evaluations : int) -> list:
+        self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
+
+        generations = []
+
+        try:
+            population, fitness = self.counter.randomSamplesArray(popSize)
+            generations.append(np.column_stack((population, fitness)))
+
+            steps = np.arange(self.step, self.pathLength, self.step)
+            indicies = np.arange(popSize)
+
+            for _ in range(M_max):
+                for offset in range(1, popSize):
+                    if self.budgetExhausted(popSize * len(steps)):
+                        break
+
+                    leaders = population[(indicies + offset) % popSize]
+                    population, fitness = migrate(self.counter, population, fitness, leaders, steps, self.PRT)
+
+                generations.append(np.column_stack((population, fitness)))
+
+                if self.budgetExhausted(popSize * len(steps)):
+                    break
+        except EvaluationBudgetExhausted:
+            pass
+
+        return generations
+
+# SOMA Team To Team Adaptive, migrants and leader are picked by tournaments,
+# step and PRT adapt to spent evaluations, last migration is shortened to fit the budget
+class SomaT3A:
+    def __init__(self, num_migrants : int = 10, num_leader_candidates : int = 2, tournament_size : int = 10, num_jumps : int = 45) -> None:
+        """
+        num_migrants: m, best individuals of migrant tournament that migrate
+        num_leader_candidates: n, leader is the best of this many random individuals
+        tournament_size: k, number of random individuals migrants are chosen from
+        num_jumps: number of path positions evaluated per migrant
+        """
+        self.numMigrants = num_migrants
+        self.numLeaderCandidates = num_leader_candidates
+        self.tournamentSize = tournament_size
+        self.numJumps = num_jumps
+
+    def init(self, seed, function : TestFunction):
+        self.seed = seed
+        self.function = function
+
+    def search(self, popSize : int, M_max :int, max_evaluations : int) -> list:
+        self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
+
+        num_migrants = min(self.numMigrants, self.tournamentSize, popSize - 1)
+        tournament_size = min(self.tournamentSize, popSize - 1)
+        num_leader_candidates = min(self.numLeaderCandidates, popSize)
+
+        # PRT grows over the budget, unlimited budget uses evaluations of M_max full migrations instead
+        horizon = max_evaluations if max_evaluations is not None else popSize + M_max * num_migrants * self.numJumps
+
+        generations = []
 
-                    clamped = self.function.preserveBoundsSetAtBorder(new_individual[:-1])
-                    new_individual = list(clamped) + [self.function.calculate(clamped)]
-                    num_evaluations += 1
+        try:
+            population, fitness = self.counter.randomSamplesArray(popSize)
+            generations.append(np.column_stack((population, fitness)))
 
-                    if(new_individual[-1] < best_individual[-1]):
-                        best_individual = copy.copy(new_individual)
+            for _ in range(M_max):
+                spent = self.counter.getEvaluations()
+                remaining = self.counter.getRemaining()
+                num_jumps = self.numJumps if remaining is None else min(self.numJumps, remaining // num_migrants)
+                if num_jumps < 1:
+                    break
 
-                if best_individual[-1] < new_leader[-1]:
-                    new_leader = copy.copy(best_individual)
+                step = 0.02 + 0.005 * np.cos(0.5 * np.pi * 1e-7 * spent)
+                PRT = 0.05 + 0.90 * (spent / horizon)
 
-                if(num_evaluations > max_evaluations):
-                    return generations
+                candidates = np.random.choice(popSize, num_leader_candidates, replace=False)
+                leader_index = candidates[np.argmin(fitness[candidates])]
 
-                new_population.append(best_individual)
+                others = np.delete(np.arange(popSize), leader_index)
+                tournament = np.random.choice(others, tournament_size, replace=False)
+                migrants = tournament[np.argsort(fitness[tournament])[:num_migrants]]
 
-            population = new_population
-            leader = new_leader
+                steps = step * np.arange(1, num_jumps + 1)
+                population[migrants], fitness[migrants] = migrate(self.counter, population[migrants], fitness[migrants],
+                                                                  population[leader_index], steps, PRT)
 
-            generations.append(population)
+                generations.append(np.column_stack((population, fitness)))
+        except EvaluationBudgetExhausted:
+            pass
 
-        return generations
\ No newline at end of file
+        return generations
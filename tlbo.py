@@ -1,72 +1,66 @@
 import numpy as np
-import copy
 
 from common.visualization import *
 from common.functions import*
+from common.evaluation import *
 
 class TLBO:
     def init(self, seed, function : TestFunction):
         self.seed = seed
         self.function = function
 
+    @staticmethod
+    def partners(num_learners : int) -> np.ndarray:
+        # random permutation, learners paired with themselves take partner of the next learner instead
+        permutation = np.random.permutation(num_learners)
+        indicies = np.arange(num_learners)
+        alone = permutation == indicies
+
+        return np.where(alone, permutation[(indicies + 1) % num_learners], permutation)
+
+    # Class is stored as (n, d) array of positions with separate fitness vector
     def search(self, popSize : int, num_generations : int, max_evaluations : int) -> list:
         self.function.setSamplingSeed(self.seed)
+        self.counter = EvaluationCounter(self.function, max_evaluations)
 
         generations = []
-        population = self.function.randomSamples(popSize)
-        generations.append(population)
-
-        num_evaluations = popSize
-
-        for _ in range(num_generations):
-            teacher = copy.copy(population[0])
-            teacher_index = 0
-            for index, individual in enumerate(population):
-                if individual[-1] < teacher[-1]:
-                    teacher = copy.copy(individual)
-                    teacher_index = index
-
-            population_mean = np.mean(population, axis=0)
-
-            new_population = [teacher]
-            
-            for index, individual in enumerate(population):
-                if index != teacher_index:
-                    new_individual = np.random.uniform() * (teacher - np.random.randint(1, 3) * population_mean) 
-                    new_individual = self.function.preserveBoundsLoopAround(new_individual[:-1])
-                    new_individual = (*new_individual, self.function.calculate(new_individual))
-
-                    num_evaluations += 1
-                    
-                    if new_individual[-1] < individual[-1]:
-                        new_population.append(new_individual)
-                    else:
-                        new_population.append(individual)
-
-            for index, individual in enumerate(new_population):
-                other_student_index = index
-                while other_student_index == index:
-                    other_student_index = np.random.randint(0, len(population))
-
-                other_student = new_population[other_student_index]
-
-                difference = np.random.uniform() * np.subtract(individual, other_student)
-                if individual[-1] > other_student[-1]:
-                    difference = np.multiply(-1, difference)
-                
-                new_individual = np.add(individual, difference)
-                new_individual = self.function.preserveBoundsLoopAround(new_individual[:-1])
-                new_individual = (*new_individual, self.function.calculate(new_individual))
-
-                num_evaluations += 1
-
-                if new_individual[-1] < individual[-1]:
-                    new_population[index] = new_individual
-
-            population = new_population
-            if num_evaluations > max_evaluations:
-                return generations
-
-            generations.append(population)
-
-        return generations
\ No newline at end of file
+
+        try:
+            population, fitness = self.counter.randomSamplesArray(popSize)
+            generations.append(np.column_stack((population, fitness)))
+
+            for _ in range(num_generations):
+                # teacher phase, everyone except teacher moves toward teacher and away from class mean
+                teacher_index = np.argmin(fitness)
+                students = np.arange(popSize) != teacher_index
+
+                population_mean = np.mean(population, axis=0)
+                teaching_factors = np.random.randint(1, 3, (popSize, 1))
+                r = np.random.random((popSize, 1))
+
+                candidates = population + r * (population[teacher_index] - teaching_factors * population_mean)
+                candidates = self.function.preserveBoundsLoopAroundBatch(candidates[students])
+                candidate_fitness = self.counter.calculateBatch(candidates)
+
+                improved = np.zeros(popSize, dtype=bool)
+                improved[students] = candidate_fitness < fitness[students]
+                population[improved] = candidates[improved[students]]
+                fitness[improved] = candidate_fitness[improved[students]]
+
+                # learner phase, every learner moves toward better partner or away from worse one
+                partners = self.partners(popSize)
+                r = np.random.random((popSize, 1))
+
+                direction = np.where((fitness < fitness[partners])[:, np.newaxis], population - population[partners], population[partners] - population)
+                candidates = self.function.preserveBoundsLoopAroundBatch(population + r * direction)
+                candidate_fitness = self.counter.calculateBatch(candidates)
+
+                improved = candidate_fitness < fitness
+                population[improved] = candidates[improved]
+                fitness[improved] = candidate_fitness[improved]
+
+                generations.append(np.column_stack((population, fitness)))
+        except EvaluationBudgetExhausted:
+            pass
+
+        return generations
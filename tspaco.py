@@ -1,164 +1,186 @@
 import math
 import numpy as np
-import random
-import copy
-
-class DistanceMatrix:
-    def __init__(self, points) -> None:
-        self.num_points = len(points)
-        self.dimensions = len(points[0])
-        self.points = points
-
-        self.distances = [[0.0 for _ in range(self.num_points)] for _ in range(self.num_points)]
-
-        def euclidean_distance(point1, point2) -> float:
-            square_sum = 0.0
-            for i in range(len(point1)):
-                square_sum += (point1[i] - point2[i]) ** 2 
-
-            return math.sqrt(square_sum)
-
-        for i in range(len(points)):
-            for o in range(i + 1, len(points)):
-                distance = euclidean_distance(points[i], points[o])
-
-                self.distances[i][o] = distance
-                self.distances[o][i] = distance
-    
-    def at(self, row: int, column : int):
-        return self.distances[row][column]
-
-    def evaluatePath(self, indicies : list[int]) -> float:
-        result = 0.0
-
-        for i in range(len(indicies) - 1):
-            result += self.distances[indicies[i]][indicies[i + 1]]
-
-        return result
 
+from common.distances import *
+from common.spatial import *
 
 class VisibilityMatrix:
     def __init__(self, distance_matrix : DistanceMatrix) -> None:
         self.num_points = distance_matrix.num_points
-        self.visiblities = [[0.0 for _ in range(self.num_points)] for _ in range(self.num_points)]
-        self.hidden = set()
-
-        for i in range(self.num_points):
-            for o in range(i + 1, self.num_points):
-                visiblity = 1.0 / distance_matrix.at(i, o)
-
-                assert(visiblity <= 1.0)
+        self.visibilities = np.empty((self.num_points, self.num_points))
 
-                self.visiblities[i][o] = visiblity
-                self.visiblities[o][i] = visiblity
+        with np.errstate(divide="ignore"):
+            for i in range(self.num_points):
+                self.visibilities[i] = 1.0 / distance_matrix.row(i)
 
-    def hideColumn(self, column_index : int):
-        self.hidden.add(column_index)
-
-    def unhideColumns(self):
-        self.hidden = set()
+        np.fill_diagonal(self.visibilities, 0.0)
 
     def at(self, row : int, column : int):
-        return 0.0 if column in self.hidden else self.visiblities[row][column]
-    
-    def visibleCities(self):
-        all_columns = set(range(0, self.num_points))
-
-        return all_columns - self.hidden
+        return self.visibilities[row, column]
     
 class PheromoneMatrix:
     def __init__(self, num_points : int) -> None:
         self.num_points = num_points
-        self.pheromones = [[1.0 for _ in range(self.num_points)] for _ in range(self.num_points)]
-        
-        for i in range(self.num_points):
-            for o in range(i + 1, self.num_points):
-                self.pheromones[i][o] = 1.0
-                self.pheromones[o][i] = 1.0
+        self.pheromones = np.ones((self.num_points, self.num_points))
+
+    def evaporate(self, evaporation : float):
+        self.pheromones *= 1.0 - evaporation
+
+    def deposit(self, paths : np.ndarray, values):
+        """
+        paths: single path or (paths, length) array, values are deposited on both directions of every edge of a path
+        """
+        paths = np.atleast_2d(paths)
+        values = np.broadcast_to(np.reshape(values, (-1, 1)), (len(paths), paths.shape[1] - 1))
+
+        np.add.at(self.pheromones, (paths[:, :-1], paths[:, 1:]), values)
+        np.add.at(self.pheromones, (paths[:, 1:], paths[:, :-1]), values)
+
+    def at(self, row, column):
+        return self.pheromones[row, column]
+
+# Pheromones kept only on edges from every city to its candidate cities, (n, k) instead of (n, n)
+class CandidatePheromoneMatrix:
+    def __init__(self, candidates : np.ndarray) -> None:
+        self.candidates = candidates
+        self.num_points = len(candidates)
+        self.pheromones = np.ones(candidates.shape)
 
     def evaporate(self, evaporation : float):
-        for i in range(self.num_points):
-            for o in range(i, self.num_points):
-                new_value = self.pheromones[i][o] * (1.0 - evaporation)
+        self.pheromones *= 1.0 - evaporation
+
+    def depositDirected(self, sources : np.ndarray, targets : np.ndarray, values : np.ndarray):
+        matches = self.candidates[sources] == targets[:, np.newaxis]
+        edges = np.any(matches, axis=1)
 
-                self.pheromones[i][o] = new_value
-                self.pheromones[o][i] = new_value
+        np.add.at(self.pheromones, (sources[edges], np.argmax(matches[edges], axis=1)), values[edges])
 
-    def deposit(self, path : list[int], value : float):
-        prev_node = path[0]
-        for next_node in path[1:]:
-            self.pheromones[prev_node][next_node] += value
-            self.pheromones[next_node][prev_node] += value
+    def deposit(self, paths : np.ndarray, values):
+        """
+        paths: single path or (paths, length) array, values are deposited on both directions of every candidate edge of a path
+        """
+        paths = np.atleast_2d(paths)
+        values = np.broadcast_to(np.reshape(values, (-1, 1)), (len(paths), paths.shape[1] - 1)).ravel()
 
-            prev_node = next_node
+        self.depositDirected(paths[:, :-1].ravel(), paths[:, 1:].ravel(), values)
+        self.depositDirected(paths[:, 1:].ravel(), paths[:, :-1].ravel(), values)
 
     def at(self, row, column):
-        return self.pheromones[row][column]
+        matches = self.candidates[row] == column
+
+        return self.pheromones[row][np.argmax(matches)] if np.any(matches) else 1.0
 
 class TSPACO:
-    def __init__(self, points : list[tuple[float, float]], pheromone_importance : float, visibility_importance : float) -> None:
+    def __init__(self, points : list[tuple[float, float]], pheromone_importance : float, visibility_importance : float,
+                 distance_matrix : DistanceMatrix = None, num_candidates : int = None) -> None:
+        """
+        num_candidates: ants choose among this many nearest neighbors of current city and go to the nearest unvisited city
+                        only when all of them are visited, pheromones are kept on candidate edges only, all edges when None
+        """
         self.points = points
-        self.distance_matrix = DistanceMatrix(points)
-        self.visibility_matrix = VisibilityMatrix(self.distance_matrix)
-        self.pheromone_matrix = PheromoneMatrix(self.distance_matrix.num_points)
+        self.distance_matrix = distance_matrix if distance_matrix is not None else DistanceMatrix(points)
         
         self.pheromone_importance = pheromone_importance
         self.visibility_importance = visibility_importance
 
-    def nextAntCity(self, current_city : int):
-        next_city_probabilities = []
-        visible_cities = self.visibility_matrix.visibleCities()
+        num_cities = self.distance_matrix.num_points
+
+        if num_candidates is None:
+            self.candidates = None
+            self.visibility_matrix = VisibilityMatrix(self.distance_matrix)
+            self.pheromone_matrix = PheromoneMatrix(num_cities)
+
+            # visibility term does not change between generations
+            self.visibility_weights = self.visibility_matrix.visibilities ** self.visibility_importance
+        else:
+            self.candidates = GridIndex(self.distance_matrix.points).nearest(min(num_candidates, num_cities - 1))[0]
+            self.visibility_matrix = None
+            self.pheromone_matrix = CandidatePheromoneMatrix(self.candidates)
+
+            sources = np.broadcast_to(np.arange(num_cities)[:, np.newaxis], self.candidates.shape)
+            self.visibility_weights = np.where(self.candidates < 0, 0.0,
+                                               (1.0 / self.distance_matrix.edgeLengths(sources, np.maximum(self.candidates, 0))) ** self.visibility_importance)
 
-        for city in visible_cities:
-            city_pheromone = self.pheromone_matrix.at(current_city, city) ** self.pheromone_importance
-            city_visibility =  self.visibility_matrix.at(current_city, city) ** self.visibility_importance
-            
-            city_probability = city_pheromone * city_visibility
-            next_city_probabilities.append((city, city_probability))
+    @staticmethod
+    def rouletteSelection(weights : np.ndarray) -> np.ndarray:
+        # column chosen in every row of weights with probability proportional to its weight, cumulative sums
+        # of every row are normalized to (0, 1] and offset by row index so one searchsorted serves all rows
+        # and no row loses resolution against totals of other rows
+        num_rows, num_columns = weights.shape
+        rows = np.arange(num_rows)
 
-        probability_sum = sum([prob[1] for prob in next_city_probabilities])
-        cummulative = 0.0
-        for i in range(len(next_city_probabilities)):
-            city, probability = next_city_probabilities[i]
+        cummulative = np.cumsum(weights, axis=1)
+        cummulative /= cummulative[:, -1:]
 
-            probability = probability / probability_sum
-            cummulative += probability
+        selectors = rows + np.random.uniform(size=num_rows)
+        flat_indicies = np.searchsorted((cummulative + rows[:, np.newaxis]).ravel(), selectors, side="right")
+        columns = np.clip(flat_indicies - rows * num_columns, 0, num_columns - 1)
 
-            next_city_probabilities[i] = (city, cummulative)
+        # selector rounded up to end of its row lands past the last column of the row with nonzero weight
+        overshot = weights[rows, columns] <= 0.0
+        columns[overshot] = np.argmax(cummulative[overshot] >= 1.0, axis=1)
 
-        city_selector = random.random()
+        return columns
 
-        next_city = None
-        for index, (city, probability) in enumerate(next_city_probabilities):
-            if probability >= city_selector:
-                next_city = next_city_probabilities[index - 1][0]
-                break
+    def nextCities(self, weights : np.ndarray, current_cities : np.ndarray, visited : np.ndarray) -> np.ndarray:
+        city_weights = np.where(visited, 0.0, weights[current_cities])
 
-        if not next_city:
-            next_city = next_city_probabilities[-1][0]
+        # ants whose weights all underflowed choose uniformly among unvisited cities
+        exhausted = ~np.any(city_weights > 0.0, axis=1)
+        city_weights[exhausted] = ~visited[exhausted]
 
-        return next_city
+        return self.rouletteSelection(city_weights)
 
-    def nextAnt(self, starting_city):
+    def nextCandidateCities(self, weights : np.ndarray, current_cities : np.ndarray, visited : np.ndarray) -> np.ndarray:
+        num_ants = len(current_cities)
+        ants = np.arange(num_ants)[:, np.newaxis]
+
+        candidates = self.candidates[current_cities]
+        candidate_weights = np.where((candidates < 0) | visited[ants, np.maximum(candidates, 0)], 0.0, weights[current_cities])
+
+        open_ants = np.any(candidate_weights > 0.0, axis=1)
+        next_cities = np.empty(num_ants, dtype=np.int64)
+
+        columns = self.rouletteSelection(candidate_weights[open_ants])
+        next_cities[open_ants] = candidates[open_ants, columns]
+
+        # ants with all candidates visited go to the nearest unvisited city, pheromone of non-candidate edges
+        # is the same for all of them so it is also the most probable one
+        for ant in np.nonzero(~open_ants)[0]:
+            distances = np.where(visited[ant], np.inf, self.distance_matrix.row(current_cities[ant]))
+            next_cities[ant] = np.argmin(distances)
+
+        return next_cities
+
+    def constructTours(self, starting_cities : np.ndarray) -> np.ndarray:
+        """
+        Builds tours of all ants at once, returns (ants, cities + 1) array of closed paths.
+        """
+        num_ants = len(starting_cities)
         num_cities = self.distance_matrix.num_points
-        path = [starting_city]
+        ants = np.arange(num_ants)
+
+        # probability weights of all (candidate) edges computed once for the whole generation
+        weights = self.pheromone_matrix.pheromones ** self.pheromone_importance * self.visibility_weights
+        next_cities_of = self.nextCities if self.candidates is None else self.nextCandidateCities
 
-        self.visibility_matrix.unhideColumns()
-        self.visibility_matrix.hideColumn(starting_city)
+        paths = np.empty((num_ants, num_cities + 1), dtype=np.int64)
+        paths[:, 0] = starting_cities
+        paths[:, -1] = starting_cities
 
-        for _ in range(num_cities - 1):
-            next_city = self.nextAntCity(path[-1])
+        visited = np.zeros((num_ants, num_cities), dtype=bool)
+        visited[ants, starting_cities] = True
 
-            path.append(next_city)
-            self.visibility_matrix.hideColumn(next_city)
+        for step in range(1, num_cities):
+            next_cities = next_cities_of(weights, paths[:, step - 1], visited)
 
-        path.append(starting_city)
+            paths[:, step] = next_cities
+            visited[ants, next_cities] = True
 
-        return path
+        return paths
 
     def run(self, num_generations : int, num_ants : int, seed : int, evaporation : float) -> tuple[list, float]:
         np.random.seed(seed)
-        random.seed(seed)
 
         best_path = None
         best_path_length = None
@@ -166,29 +188,21 @@ class TSPACO:
         gen_data = []
        
         num_cities = self.distance_matrix.num_points
+        starting_cities = np.arange(num_ants) % num_cities
+
         for gen in range(num_generations):
-            ant_paths = []
-            
-            city_start = 0
-            for i in range(num_ants):
-                ant_paths.append(self.nextAnt(city_start % num_cities))
-                city_start += 1
+            ant_paths = self.constructTours(starting_cities)
+            path_lengths = np.sum(self.distance_matrix.edgeLengths(ant_paths[:, :-1], ant_paths[:, 1:]), axis=1)
 
             self.pheromone_matrix.evaporate(evaporation)
+            self.pheromone_matrix.deposit(ant_paths, 1.0 / path_lengths)
 
-            for path in ant_paths:
-                path_length = self.distance_matrix.evaluatePath(path)
-
-                if not best_path:
-                    best_path = path
-                    best_path_length = path_length
-                elif path_length < best_path_length:
-                    best_path = path
-                    best_path_length = path_length
-
-                self.pheromone_matrix.deposit(path, 1.0 / path_length)
+            best_ant = np.argmin(path_lengths)
+            if best_path is None or path_lengths[best_ant] < best_path_length:
+                best_path = ant_paths[best_ant].tolist()
+                best_path_length = float(path_lengths[best_ant])
 
             gen_data.append(best_path)
             print(best_path_length)
 
-        return gen_data
\ No newline at end of file
+        return gen_data
@@ -1,157 +1,316 @@
 import math
 import numpy as np
-import random
-import copy
 
-class DistanceMatrix:
-    def __init__(self, points) -> None:
-        self.num_points = len(points)
-        self.dimensions = len(points[0])
-        self.points = points
+from collections import deque
 
-        self.distances = [[0.0 for _ in range(self.num_points)] for _ in range(self.num_points)]
+from common.distances import *
+from common.spatial import *
 
-        def euclidean_distance(point1, point2) -> float:
-            square_sum = 0.0
-            for i in range(len(point1)):
-                square_sum += (point1[i] - point2[i]) ** 2 
+# Population stored as arrays, genes[i] is tour of individual i without starting city 0,
+# edgeLengths[i, k] is length of edge (path[k], path[k + 1]) of its path 0 + genes + 0
+class TourPopulation:
+    def __init__(self, genes : np.ndarray, distance_matrix : DistanceMatrix) -> None:
+        self.genes = genes
 
-            return math.sqrt(square_sum)
+        paths = self.paths()
+        self.edgeLengths = np.asarray(distance_matrix.edgeLengths(paths[:, :-1], paths[:, 1:]), dtype=np.float64)
+        self.pathLengths = np.sum(self.edgeLengths, axis=1)
 
-        for i in range(len(points)):
-            for o in range(i + 1, len(points)):
-                distance = euclidean_distance(points[i], points[o])
+    def __len__(self) -> int:
+        return len(self.genes)
 
-                self.distances[i][o] = distance
-                self.distances[o][i] = distance
-    
-    def evaluatePath(self, indicies : list[int]) -> float:
-        result = 0.0
+    def paths(self) -> np.ndarray:
+        depot = np.zeros((len(self.genes), 1), dtype=self.genes.dtype)
 
-        for i in range(len(indicies) - 1):
-            result += self.distances[indicies[i]][indicies[i + 1]]
+        return np.hstack((depot, self.genes, depot))
 
-        return result
+    def getPath(self, index : int) -> list[int]:
+        return [0] + self.genes[index].tolist() + [0]
 
+    def getPathLength(self, index : int) -> float:
+        return float(self.pathLengths[index])
 
-class Individual:
-    def __init__(self, genes : list[int]) -> None:
-        self.genes = genes.copy()
-        self.path = [0] + genes + [0]
-        self.pathLength = None
+# Cities at given path positions of given rows, positions 0 and len(genes) + 1 are starting city 0
+def pathCities(genes : np.ndarray, rows : np.ndarray, positions : np.ndarray) -> np.ndarray:
+    inside = (positions > 0) & (positions <= genes.shape[1])
 
-    def createOffspring(self, other):
-        num_first_parent_genes = int(len(self.genes) / 2)
+    return np.where(inside, genes[rows, np.clip(positions - 1, 0, genes.shape[1] - 1)], 0)
 
-        first_parent_genes = self.genes[:num_first_parent_genes]
-        second_parent_genes = other.genes[num_first_parent_genes:]
+# 2-opt and Or-opt moves restricted to k nearest neighbors of every city, cities whose surroundings
+# did not change since their last unsuccessful check are skipped (don't-look bits)
+class TourLocalSearch:
+    def __init__(self, distance_matrix : DistanceMatrix, num_neighbors : int = 10, max_segment_length : int = 3) -> None:
+        """
+        num_neighbors: size of candidate list of every city
+        max_segment_length: longest segment Or-opt moves
+        """
+        self.distance_matrix = distance_matrix
+        self.maxSegmentLength = max_segment_length
 
-        if len(first_parent_genes) + len(second_parent_genes) != len(self.genes):
-            raise RuntimeError("Wrong resulting genome")
+        # candidate lists sorted by distance
+        self.neighbors = GridIndex(distance_matrix.points).nearest(min(num_neighbors, distance_matrix.num_points - 1))[0]
+        self.neighborLists = [[city for city in row if city >= 0] for row in self.neighbors.tolist()]
 
-        second_parent_needed_genes = set(self.genes) - set(first_parent_genes)
+    def distance(self, first : int, second : int) -> float:
+        return float(self.distance_matrix.at(first, second))
 
-        new_genes = first_parent_genes + second_parent_genes
-        to_replace_indicies = []
+    def reverse(self, tour : np.ndarray, positions : np.ndarray, start : int, end : int) -> None:
+        # reverses cyclic segment tour[start..end], wrapping segment is reversed through its complement
+        if start > end:
+            start, end = end + 1, start - 1
 
-        for i in range(num_first_parent_genes, len(self.genes)):
-            if new_genes[i] not in second_parent_needed_genes:
-                to_replace_indicies.append(i)
-            else:
-                second_parent_needed_genes.remove(new_genes[i])
+        if start < end:
+            tour[start:end + 1] = tour[start:end + 1][::-1]
+            positions[tour[start:end + 1]] = np.arange(start, end + 1)
+
+    def twoOpt(self, tour : np.ndarray, positions : np.ndarray, city : int) -> list[int]:
+        num_cities = len(tour)
+
+        for step in (1, -1):
+            next_city = tour[(positions[city] + step) % num_cities]
+            city_edge = self.distance(city, next_city)
+
+            for other in self.neighborLists[city]:
+                new_edge = self.distance(city, other)
+                if new_edge >= city_edge:
+                    break
+
+                other_next = tour[(positions[other] + step) % num_cities]
+                if other_next == city:
+                    continue
+
+                if new_edge + self.distance(next_city, other_next) < city_edge + self.distance(other, other_next) - 1e-10:
+                    if step == 1:
+                        self.reverse(tour, positions, positions[next_city], positions[other])
+                    else:
+                        self.reverse(tour, positions, positions[city], positions[other_next])
 
-            leftover_genes = list(second_parent_needed_genes)
-        assert(len(second_parent_needed_genes) == len(to_replace_indicies))
+                    return [city, next_city, other, other_next]
 
-        for o in range(len(to_replace_indicies)):
-            new_genes[to_replace_indicies[o]] = leftover_genes[o]
-        
-        assert(len(set(new_genes)) == len(self.genes))
+        return []
 
-        return Individual(new_genes)
+    def orOpt(self, tour : np.ndarray, positions : np.ndarray, city : int) -> list[int]:
+        num_cities = len(tour)
+        start = positions[city]
 
-    def mutate(self) -> None:
-        first_gene_index, second_gene_index = random.randint(0, len(self.genes) -1), random.randint(0, len(self.genes) -1)
+        for length in range(1, min(self.maxSegmentLength, num_cities - 3) + 1):
+            first, last = city, tour[(start + length - 1) % num_cities]
+            previous, following = tour[start - 1], tour[(start + length) % num_cities]
 
-        while first_gene_index == second_gene_index:
-            second_gene_index = random.randint(0, len(self.genes) -1)
+            removal_gain = self.distance(previous, first) + self.distance(last, following) - self.distance(previous, following)
+            if removal_gain <= 1e-10:
+                continue
 
-        tmp = self.genes[first_gene_index]
-        self.genes[first_gene_index] = self.genes[second_gene_index]
-        self.genes[second_gene_index] = tmp
+            for end, other_end in ((first, last), (last, first)):
+                for other in self.neighborLists[end]:
+                    new_edge = self.distance(end, other)
+                    if new_edge >= removal_gain:
+                        break
+
+                    if (positions[other] - start) % num_cities < length:
+                        continue
 
-        self.path = [0] + self.genes + [0]
-        self.pathLength = None
+                    for step in (1, -1):
+                        other_next = tour[(positions[other] + step) % num_cities]
+                        if (positions[other_next] - start) % num_cities < length:
+                            continue
 
-    def getPath(self) -> list[int]:
-        return self.path
+                        if new_edge + self.distance(other_end, other_next) - self.distance(other, other_next) < removal_gain - 1e-10:
+                            segment = tour[(start + np.arange(length)) % num_cities]
+                            rest = np.delete(tour, (start + np.arange(length)) % num_cities)
 
-    def calculatePathLength(self, distance_matrix : DistanceMatrix) -> float:
-        self.pathLength = distance_matrix.evaluatePath(self.path)
+                            # end of segment goes next to other, in direction of other_next
+                            if step == -1:
+                                segment = segment[::-1] if end == first else segment
+                                insert_at = np.nonzero(rest == other)[0][0]
+                            else:
+                                segment = segment if end == first else segment[::-1]
+                                insert_at = np.nonzero(rest == other)[0][0] + 1
+
+                            tour[:] = np.insert(rest, insert_at, segment)
+                            positions[tour] = np.arange(num_cities)
+
+                            return [previous, following, first, last, other, other_next]
+
+        return []
+
+    def improve(self, tour : np.ndarray, active : np.ndarray = None) -> np.ndarray:
+        """
+        Returns locally optimal tour as cycle of all cities.
+        active: cities checked first, all cities when None, others are checked only when their surroundings change
+        """
+        tour = np.array(tour)
+        positions = np.empty(len(tour), dtype=np.int64)
+        positions[tour] = np.arange(len(tour))
+
+        queue = deque(tour.tolist() if active is None else np.unique(active).tolist())
+        queued = np.zeros(len(tour), dtype=bool)
+        queued[list(queue)] = True
 
-        return self.pathLength
+        while queue:
+            city = queue.popleft()
+            queued[city] = False
 
-    def getPathLength(self) -> float:
-        if self.pathLength is None:
-            raise RuntimeError("Path length was not calculated")
-        
-        return self.pathLength
+            changed = self.twoOpt(tour, positions, city) or self.orOpt(tour, positions, city)
+            for changed_city in changed:
+                if not queued[changed_city]:
+                    queued[changed_city] = True
+                    queue.append(changed_city)
+
+        return tour
 
 class TSPGA:
-    def __init__(self, points : list[tuple[float, float]], ) -> None:
+    def __init__(self, points : list[tuple[float, float]], distance_matrix : DistanceMatrix = None,
+                 local_search : bool = False, num_neighbors : int = 10) -> None:
+        """
+        local_search: improve initial population and every offspring by 2-opt and Or-opt moves
+        num_neighbors: size of candidate lists of local search
+        """
         self.points = points
-        self.distance_matrix = DistanceMatrix(points)
+        self.distance_matrix = distance_matrix if distance_matrix is not None else DistanceMatrix(points)
+        self.localSearch = TourLocalSearch(self.distance_matrix, num_neighbors) if local_search else None
+
+    def randomPopulation(self, num_individuals: int) -> TourPopulation:
+        num_genes = self.distance_matrix.num_points - 1
+        genes = np.argsort(np.random.random((num_individuals, num_genes)), axis=1) + 1
+
+        return TourPopulation(genes, self.distance_matrix)
+
+    def crossover(self, population : TourPopulation, second_parents : np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Offspring take first half of genes from individual at the same index and the rest from its second parent,
+        genes already present in the first half are replaced by the missing ones in order of the first parent.
+        Returns genes and edge lengths of offspring, only edges changed against parents are looked up.
+        """
+        num_individuals, num_genes = population.genes.shape
+        half = num_genes // 2
+        rows = np.arange(num_individuals)[:, np.newaxis]
+
+        first_tails = population.genes[:, half:]
+        second_tails = population.genes[second_parents, half:]
+
+        in_head = np.zeros((num_individuals, num_genes + 1), dtype=bool)
+        in_head[rows, population.genes[:, :half]] = True
+        in_second_tail = np.zeros((num_individuals, num_genes + 1), dtype=bool)
+        in_second_tail[rows, second_tails] = True
+
+        duplicates = in_head[rows, second_tails]
+        missing = ~in_second_tail[rows, first_tails]
+
+        # both masks have the same count per row, row-major order pairs them up row by row
+        tails = second_tails.copy()
+        tails[duplicates] = first_tails[missing]
+        genes = np.hstack((population.genes[:, :half], tails))
+
+        edge_lengths = np.hstack((population.edgeLengths[:, :half], population.edgeLengths[second_parents, half:]))
+
+        # joining edge and both edges of every replaced gene (gene j lies between edges j and j + 1)
+        changed = np.zeros(edge_lengths.shape, dtype=bool)
+        changed[:, half] = True
+        changed[:, half:num_genes] |= duplicates
+        changed[:, half + 1:] |= duplicates
+
+        edge_rows, edges = np.nonzero(changed)
+        edge_lengths[edge_rows, edges] = self.distance_matrix.edgeLengths(pathCities(genes, edge_rows, edges), pathCities(genes, edge_rows, edges + 1))
+
+        return genes, edge_lengths
+
+    def mutate(self, genes : np.ndarray, edge_lengths : np.ndarray, mutated : np.ndarray) -> None:
+        # swaps two random genes of every mutated individual in place, only the (at most four) edges touching them are looked up
+        rows = np.nonzero(mutated)[0]
+        num_genes = genes.shape[1]
+
+        first = np.random.randint(0, num_genes, len(rows))
+        second = np.random.randint(0, num_genes - 1, len(rows))
+        second += second >= first
+        first, second = np.minimum(first, second), np.maximum(first, second)
+
+        genes[rows, first], genes[rows, second] = genes[rows, second], genes[rows, first]
+
+        edges = np.column_stack((first, first + 1, second, second + 1))
+        edge_rows = np.broadcast_to(rows[:, np.newaxis], edges.shape)
+
+        edge_lengths[edge_rows, edges] = self.distance_matrix.edgeLengths(pathCities(genes, edge_rows, edges), pathCities(genes, edge_rows, edges + 1))
+
+    def improve(self, genes : np.ndarray, parents : list[np.ndarray] = None) -> np.ndarray:
+        """
+        Applies local search to every row of genes in place, returns rows that changed.
+        parents: gene arrays of parents, only cities at edges found in no parent are checked first
+        """
+        num_individuals, num_genes = genes.shape
+        rows = np.arange(num_individuals)[:, np.newaxis]
+        tours = np.hstack((np.zeros((num_individuals, 1), dtype=genes.dtype), genes))
+
+        if parents is not None:
+            successors = np.roll(tours, -1, axis=1)
+            inherited = np.zeros(tours.shape, dtype=bool)
+
+            for parent_genes in parents:
+                parent_tours = np.hstack((np.zeros((num_individuals, 1), dtype=genes.dtype), parent_genes))
+                parent_positions = np.empty_like(parent_tours)
+                parent_positions[rows, parent_tours] = np.arange(num_genes + 1)
+
+                # edge (city, successor) exists in parent when successor is next to city there in either direction
+                city_positions = parent_positions[rows, tours]
+                successor_positions = parent_positions[rows, successors]
+                inherited |= np.isin((successor_positions - city_positions) % (num_genes + 1), (1, num_genes))
+
+        changed = np.zeros(num_individuals, dtype=bool)
+
+        for i in range(num_individuals):
+            if parents is None:
+                active = None
+            else:
+                new_edges = np.nonzero(~inherited[i])[0]
+                if len(new_edges) == 0:
+                    continue
+
+                active = np.concatenate((tours[i, new_edges], tours[i, (new_edges + 1) % (num_genes + 1)]))
 
-    def randomPopulation(self, num_individuals: int) -> list[Individual]:
-        indicies = [x for x in range(1, len(self.points))]
-        population = []
+            tour = self.localSearch.improve(tours[i], active)
+            tour = np.roll(tour, -np.nonzero(tour == 0)[0][0])
 
-        for _ in range(num_individuals):
-            np.random.shuffle(indicies)
-            population.append(Individual(indicies))
+            changed[i] = np.any(tour[1:] != genes[i])
+            genes[i] = tour[1:]
 
-        return population
+        return np.nonzero(changed)[0]
 
-    def run(self, num_generations : int, num_individuals : int, seed : int) -> tuple[list, float]:
+    def run(self, num_generations : int, num_individuals : int, seed : int) -> tuple[TourPopulation, list]:
         np.random.seed(seed)
-        random.seed(seed)
 
         gen_data = []
 
         population = self.randomPopulation(num_individuals)
-        for individual in population:
-            individual.calculatePathLength(self.distance_matrix)
 
-        for gen in range(num_generations):
-            new_population = copy.deepcopy(population)
-
-            for i in range(num_individuals):
-                first_parent = population[i]
+        if self.localSearch is not None:
+            self.improve(population.genes)
+            population = TourPopulation(population.genes, self.distance_matrix)
 
-                second_parent_index = random.randint(0, num_individuals -1)
-                while(second_parent_index) == i:
-                    second_parent_index = random.randint(0, num_individuals -1)
+        for gen in range(num_generations):
+            second_parents = np.random.randint(0, num_individuals - 1, num_individuals)
+            second_parents += second_parents >= np.arange(num_individuals)
 
-                new_individual = first_parent.createOffspring(population[second_parent_index])
+            genes, edge_lengths = self.crossover(population, second_parents)
+            self.mutate(genes, edge_lengths, np.random.uniform(size=num_individuals) < 0.5)
 
-                if np.random.uniform() < 0.5:
-                    new_individual.mutate()
+            if self.localSearch is not None:
+                improved_rows = self.improve(genes, [population.genes, population.genes[second_parents]])
 
-                new_individual_path_length = new_individual.calculatePathLength(self.distance_matrix)
-                parent_path_length = first_parent.getPathLength()
+                paths = np.hstack((np.zeros((len(improved_rows), 1), dtype=genes.dtype), genes[improved_rows], np.zeros((len(improved_rows), 1), dtype=genes.dtype)))
+                edge_lengths[improved_rows] = self.distance_matrix.edgeLengths(paths[:, :-1], paths[:, 1:])
 
-                if new_individual_path_length < parent_path_length:
-                    new_population[i] = new_individual
+            path_lengths = np.sum(edge_lengths, axis=1)
 
-            population = new_population
+            # offspring replaces its first parent when it is shorter
+            improved = path_lengths < population.pathLengths
+            population.genes[improved] = genes[improved]
+            population.edgeLengths[improved] = edge_lengths[improved]
+            population.pathLengths[improved] = path_lengths[improved]
 
-            mindist = population[0].getPathLength()
-            maxdist = mindist
-            for i in range(1, num_individuals):
-                mindist = min(mindist, population[i].getPathLength())
-                maxdist = max(maxdist, population[i].getPathLength())
+            mindist = float(np.min(population.pathLengths))
+            maxdist = float(np.max(population.pathLengths))
 
             print(gen, mindist, maxdist)
             gen_data.append({"min": mindist, "max": maxdist})
 
-        return population, gen_data
\ No newline at end of file
+        return population, gen_data